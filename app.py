@@ -11,6 +11,8 @@ from controllers.cart_controller import cart_bp
 from controllers.feedback_controller import feedback_bp
 from controllers.admin_controller import admin_bp
 from controllers.order_controller import order_bp
+from services.recommendation_service import recommendation_engine
+from services.search_index import product_search
 
 import os
 
@@ -30,6 +32,23 @@ def create_app():
     app.register_blueprint(admin_bp)
     app.register_blueprint(order_bp)
 
+    recommendation_engine.init_app(app)
+
+    # Warm the recommendation model so the first product page doesn't pay for it
+    if app.config.get('RECOMMENDATION_PRELOAD'):
+        with app.app_context():
+            try:
+                recommendation_engine.load()
+            except Exception as e:
+                print(f"Error preloading recommendation model: {e}")
+
+    if app.config.get('SEARCH_PRELOAD'):
+        with app.app_context():
+            try:
+                product_search.build()
+            except Exception as e:
+                print(f"Error building product search index: {e}")
+
     # Set up the index route to point to the product index
     @app.route('/')
     def index():
@@ -0,0 +1,201 @@
+"""
+Recommendation training and lookup benchmarks over growing synthetic catalogs.
+
+For each catalog size this generates a dataset with datasetGenerator.py, trains
+it with modelTrainning.py into a scratch artifacts directory, then loads the
+model into an in-process RecommendationEngine (catalog read from the CSV, no
+database) and measures lookups. Per size it records:
+
+  * training wall time and peak RSS (trainer plus its worker processes)
+  * artifact size on disk and engine load time
+  * cold (first request after load) and warm (repeat) lookup latency, p50/p99
+  * lookups per second from several threads sharing the engine
+
+Results go to a JSON file tagged with the git revision, so runs from different
+versions can be diffed.
+
+    python benchmarks/recommendations.py --sizes 1000 10000 --threads 1 4
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services.recommendation_service import RecommendationEngine  # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+DEFAULT_THREADS = [1, 4, 8]
+
+def run_measured(command, env=None):
+    """Run ``command`` from the repo root; return wall seconds, peak RSS in MB and its output"""
+    started = time.perf_counter()
+    with tempfile.TemporaryFile('w+') as log:
+        process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT, text=True)
+        # wait4 reports the child's own peak RSS, including the workers it reaped
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        log.seek(0)
+        output = log.read()
+    if process.returncode:
+        raise RuntimeError(f"{' '.join(command)} failed:\n{output}")
+    return time.perf_counter() - started, usage.ru_maxrss / 1024, output
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def csv_catalog_loader(csv_path):
+    """Catalog loader reading the ML products straight from the generated CSV"""
+    def load():
+        df = pd.read_csv(csv_path, usecols=['Product_ID', 'Product_Name', 'Category', 'Description', 'Price'])
+        return [
+            {'product_id': int(pid), 'product_name': name, 'category': category,
+             'description': description, 'price': float(price)}
+            for pid, name, category, description, price in df.itertuples(index=False)
+        ]
+    return load
+
+def percentiles(latencies):
+    values = np.asarray(latencies) * 1e3
+    return {'p50_ms': float(np.percentile(values, 50)), 'p99_ms': float(np.percentile(values, 99)),
+            'mean_ms': float(values.mean()), 'samples': len(values)}
+
+def time_calls(function, arguments):
+    latencies = []
+    for argument in arguments:
+        started = time.perf_counter()
+        function(argument)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+def throughput(engine, product_ids, threads, seconds):
+    """Lookups per second from ``threads`` threads sharing one engine"""
+    counts = [0] * threads
+    stop = threading.Event()
+
+    def worker(slot):
+        rng = np.random.default_rng(slot)
+        while not stop.is_set():
+            engine.get_recommendations_by_id(int(product_ids[rng.integers(len(product_ids))]), 5)
+            counts[slot] += 1
+
+    workers = [threading.Thread(target=worker, args=(slot,)) for slot in range(threads)]
+    for thread in workers:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in workers:
+        thread.join()
+    return sum(counts) / seconds
+
+def bench_size(size, args, workdir):
+    size_dir = os.path.join(workdir, str(size))
+    artifacts_dir = os.path.join(size_dir, 'ml_artifacts')
+    csv_path = os.path.join(size_dir, 'ml_products.csv')
+    env = dict(os.environ, ML_ARTIFACTS_DIR=artifacts_dir)
+
+    generate_seconds, _, _ = run_measured([
+        sys.executable, 'datasetGenerator.py', '--products', str(size), '--seed', str(args.seed),
+        '--out-dir', size_dir, '--ml-products-csv', 'ml_products.csv', '--workers', str(args.workers)
+    ], env)
+    train_command = [sys.executable, 'modelTrainning.py', '--csv', csv_path, '--workers', str(args.workers)]
+    if args.index == 'ann':
+        train_command.append('--ann')
+    train_seconds, train_rss_mb, _ = run_measured(train_command, env)
+
+    engine = RecommendationEngine(artifacts_dir=artifacts_dir, catalog_loader=csv_catalog_loader(csv_path))
+    engine.index_mode = args.index
+    engine.check_interval = float('inf')
+    engine.load()
+    stats = engine.stats()
+    version_dir = os.path.join(artifacts_dir, stats['version'])
+
+    rng = np.random.default_rng(args.seed)
+    product_ids = np.asarray(engine.state.product_ids)
+    sample = [int(pid) for pid in rng.choice(product_ids, size=min(args.lookups, len(product_ids)), replace=False)]
+    names = list(engine.state.rows_by_name)
+
+    by_id = lambda pid: engine.get_recommendations_by_id(pid, 5)  # noqa: E731
+    by_name = lambda name: engine.get_recommendations(name, 5)  # noqa: E731
+    result = {
+        'catalog_size': size,
+        'index_mode': args.index,
+        'generate_seconds': generate_seconds,
+        'train_seconds': train_seconds,
+        'train_peak_rss_mb': train_rss_mb,
+        'artifact_bytes': directory_size(version_dir),
+        'load_seconds': stats['load_seconds'],
+        'engine_resident_bytes': stats['resident_bytes'],
+        'engine_mapped_bytes': stats['mapped_bytes'],
+        # By id: never memoized, so cold vs warm is page cache and CPU cache warmth
+        'lookup_by_id': {'cold': percentiles(time_calls(by_id, sample)),
+                         'warm': percentiles(time_calls(by_id, sample))},
+        # By name: cold includes ranking every row carrying the name, warm is the memoized result
+        'lookup_by_name': {'cold': percentiles(time_calls(by_name, names)),
+                           'warm': percentiles(time_calls(by_name, names * max(1, args.lookups // len(names))))},
+        'throughput_per_second': {str(threads): throughput(engine, sample, threads, args.throughput_seconds)
+                                  for threads in args.threads}
+    }
+    return result
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark recommendation training and lookups')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Catalog sizes to run')
+    parser.add_argument('--threads', type=int, nargs='+', default=DEFAULT_THREADS,
+                        help='Thread counts for the throughput test')
+    parser.add_argument('--index', choices=['table', 'ann'], default='table', help='Lookup index to benchmark')
+    parser.add_argument('--lookups', type=int, default=1000, help='Products sampled for latency')
+    parser.add_argument('--throughput-seconds', type=float, default=3.0, help='Duration of each throughput run')
+    parser.add_argument('--workers', type=int, default=1, help='Processes for generation and training')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None,
+                        help='Results file (default: benchmarks/results/recommendations-<revision>.json)')
+    args = parser.parse_args()
+
+    revision = git_revision()
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results',
+                                         f"recommendations-{(revision or 'unknown')[:12]}.json")
+    report = {
+        'revision': revision,
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'cpus': os.cpu_count(),
+        'settings': {key: value for key, value in vars(args).items() if key != 'output'},
+        'results': []
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            result = bench_size(size, args, workdir)
+            report['results'].append(result)
+            print(f"{size:>8} rows: train {result['train_seconds']:.1f}s / {result['train_peak_rss_mb']:.0f} MB, "
+                  f"artifacts {result['artifact_bytes'] / 1e6:.1f} MB, "
+                  f"by id p50/p99 {result['lookup_by_id']['warm']['p50_ms']:.3f}/"
+                  f"{result['lookup_by_id']['warm']['p99_ms']:.3f} ms, "
+                  f"{max(result['throughput_per_second'].values()):.0f} lookups/s", flush=True)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Compare how the recommendation vectorizer formats load.
+
+Saves one fitted vocabulary three ways (the old scikit-learn pickle, the compact
+NumPy arrays and the hashing vectorizer), then loads each in a fresh Python
+process and reports import + load time, the memory the load added, the size
+on disk and the per-query transform time.
+
+    python benchmarks/vectorizer_load.py --vocabulary 200000
+    python benchmarks/vectorizer_load.py --csv dairy_products_large.csv
+"""
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer, ENGLISH_STOP_WORDS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services.text_vectorizer import CompactTfidfVectorizer, HashingTfidfVectorizer  # noqa: E402
+
+# Runs in a clean interpreter so import cost and RSS belong to one format only
+LOADER = r'''
+import json, os, sys, time
+sys.path.insert(0, {root!r})
+
+def resident_mb():
+    # Current RSS; ru_maxrss would include the parent's peak inherited through fork
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+baseline = resident_mb()
+started = time.perf_counter()
+if {kind!r} == 'pickle':
+    import pickle
+    with open({path!r}, 'rb') as f:
+        vectorizer = pickle.load(f)
+else:
+    from services.text_vectorizer import load_vectorizer
+    vectorizer = load_vectorizer({path!r})
+load_seconds = time.perf_counter() - started
+load_rss_mb = resident_mb() - baseline
+
+queries = {queries!r}
+started = time.perf_counter()
+for query in queries:
+    vectorizer.transform([query])
+transform_ms = (time.perf_counter() - started) / len(queries) * 1e3
+print(json.dumps({{
+    'load_ms': load_seconds * 1e3,
+    'load_rss_mb': load_rss_mb,
+    'transform_ms': transform_ms,
+    'sklearn_imported': 'sklearn' in sys.modules
+}}))
+'''
+
+def synthetic_texts(n_texts, vocabulary_size, words_per_text=12, seed=0):
+    """Random documents over a made-up vocabulary of the requested size"""
+    rng = np.random.default_rng(seed)
+    letters = np.array(list('abcdefghijklmnopqrstuvwxyz'))
+    words = [''.join(rng.choice(letters, size=rng.integers(4, 11))) for _ in range(vocabulary_size)]
+    picks = rng.integers(0, vocabulary_size, size=(n_texts, words_per_text))
+    return [' '.join(words[i] for i in row) for row in picks]
+
+def disk_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def measure(kind, path, queries):
+    script = LOADER.format(root=ROOT, kind=kind, path=path, queries=queries)
+    output = subprocess.run([sys.executable, '-c', script], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark vectorizer artifact formats')
+    parser.add_argument('--csv', help='Fit on this ML product dataset instead of synthetic text')
+    parser.add_argument('--vocabulary', type=int, default=100000, help='Synthetic vocabulary size')
+    parser.add_argument('--texts', type=int, default=50000, help='Synthetic documents to fit on')
+    parser.add_argument('--hashing-features', type=int, default=2 ** 16, help='Hashing vectorizer columns')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    if args.csv:
+        df = pd.read_csv(args.csv)
+        texts = (df['Description'] + ' ' + df['Ingredients']).tolist()
+    else:
+        texts = synthetic_texts(args.texts, args.vocabulary)
+    queries = texts[:200]
+
+    sklearn_vectorizer = TfidfVectorizer(stop_words='english').fit(texts)
+    with tempfile.TemporaryDirectory() as workdir:
+        pickle_path = os.path.join(workdir, 'vectorizer.pkl')
+        with open(pickle_path, 'wb') as f:
+            pickle.dump(sklearn_vectorizer, f)
+        compact_dir = os.path.join(workdir, 'compact')
+        os.makedirs(compact_dir)
+        CompactTfidfVectorizer.from_sklearn(sklearn_vectorizer).save(compact_dir)
+        hashing_dir = os.path.join(workdir, 'hashing')
+        os.makedirs(hashing_dir)
+        HashingTfidfVectorizer.fit(texts, args.hashing_features, stop_words=ENGLISH_STOP_WORDS).save(hashing_dir)
+
+        results = {'texts': len(texts), 'vocabulary': len(sklearn_vectorizer.vocabulary_), 'formats': {}}
+        for name, kind, path in (('pickle', 'pickle', pickle_path),
+                                 ('compact', 'npy', compact_dir),
+                                 ('hashing', 'npy', hashing_dir)):
+            results['formats'][name] = dict(measure(kind, path, queries), disk_bytes=disk_size(path))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{results['texts']} texts, {results['vocabulary']} terms")
+    print(f"{'format':<10}{'load ms':>10}{'load RSS MB':>13}{'disk MB':>10}{'query ms':>10}  sklearn")
+    for name, r in results['formats'].items():
+        print(f"{name:<10}{r['load_ms']:>10.1f}{r['load_rss_mb']:>13.1f}{r['disk_bytes'] / 1e6:>10.2f}"
+              f"{r['transform_ms']:>10.3f}  {'yes' if r['sklearn_imported'] else 'no'}")
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import os
+import sys
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -33,8 +34,57 @@ class Config:
     
     # ML Model Configuration
     TFIDF_VECTORIZER_PATH = 'tfidf_vectorizer.pkl'
-    COSINE_SIM_PATH = 'cosine_sim.pkl'
+    COSINE_SIM_PATH = 'cosine_sim.pkl'  # Legacy dense matrix, used only if no artifacts are published
+    ML_ARTIFACTS_DIR = os.getenv('ML_ARTIFACTS_DIR', 'ml_artifacts')
+    ML_ARTIFACTS_KEEP = 3  # Versions kept on disk after publishing a new one
+    ML_ARTIFACTS_CHECK_SECONDS = 5  # How often workers look for a newly published version
+    ML_ARTIFACTS_VERIFY = True  # Check a version's file sizes against its manifest before serving it
+    # Sending this signal (e.g. 'SIGURG') to a worker reloads the published model in the background. Off by
+    # default: workers already poll CURRENT, and gunicorn claims USR1/USR2/HUP/TTIN/TTOU/WINCH for itself and
+    # resets them in its workers, so a handler for those is dropped and the signal stops the worker instead
+    RECOMMENDATION_RELOAD_SIGNAL = os.getenv('RECOMMENDATION_RELOAD_SIGNAL') or None
+    RECOMMENDATION_TOP_K = int(os.getenv('RECOMMENDATION_TOP_K', '20'))
+    # 'table' serves precomputed neighbors; 'ann' queries the LSH index built with --ann
+    RECOMMENDATION_INDEX = os.getenv('RECOMMENDATION_INDEX', 'table')
+    ANN_TABLES = 16
+    ANN_BITS = None  # Hyperplanes per table; None derives it from the catalog size (about 64 rows per bucket)
+    # 'tfidf' stores the fitted vocabulary; 'hashing' hashes tokens to HASHING_FEATURES columns instead
+    RECOMMENDATION_VECTORIZER = os.getenv('RECOMMENDATION_VECTORIZER', 'tfidf')
+    HASHING_FEATURES = 2 ** 16
+    RECOMMENDATIONS_PER_PRODUCT = 5  # Rows kept per product in product_recommendation
+    RECOMMENDATION_BATCH_LIMIT = 100  # Most products accepted by /api/recommendations
+    SEARCH_RESULT_LIMIT = 50  # Most results one search returns
+    # Incremental updates trigger a full refit once this share of new tokens is out of vocabulary
+    RECOMMENDATION_DRIFT_THRESHOLD = 0.2
+    RECOMMENDATION_DRIFT_MIN_TOKENS = 50
+    # Absolute, so workers started from any directory can launch it
+    RECOMMENDATION_REFIT_COMMAND = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'modelTrainning.py'),
+        '--source', 'db', '--write-db'
+    ]
     ML_PRODUCTS_CSV = 'dairy_products_large.csv'
+    TRAINING_CHUNK_SIZE = 10000  # MLProduct rows fetched per round trip when training from the database
+    # Load the recommendation model when the app starts instead of on first use
+    RECOMMENDATION_PRELOAD = os.getenv('RECOMMENDATION_PRELOAD', 'False').lower() == 'true'
+    
+    # Product search index
+    SEARCH_SYNC_SECONDS = 30  # How often workers index products edited through other workers
+    SEARCH_POSTINGS_PER_TERM = 1000  # Best-scoring postings read per query term
+    SEARCH_FUZZY_THRESHOLD = 0.3  # Least trigram similarity for a typo-tolerant match
+    SEARCH_SUGGEST_LIMIT = 10  # Most autocomplete suggestions one request returns
+    # Build the search index when the app starts, so no user's search pays for the full product scan
+    SEARCH_PRELOAD = os.getenv('SEARCH_PRELOAD', 'True').lower() == 'true'
+    
+    # Frequently bought together
+    COPURCHASE_TOP_K = 20  # Co-purchased products cached per product
+    COPURCHASE_SYNC_SECONDS = 30  # How often workers pull orders placed through other workers
+    # Order items below the high-water mark re-read on each sync, for orders that committed out of id order
+    COPURCHASE_RESCAN_ITEMS = 5000
+    
+    # Personalized recommendations
+    PROFILE_SYNC_SECONDS = 30  # How often a cached profile picks up orders placed through other workers
+    PROFILE_CACHE_SIZE = 10000  # Most user profiles kept per worker
+    PROFILE_MAX_TERMS = 200  # Heaviest TF-IDF terms kept in a profile; the rest are dropped
     
     # Admin Configuration
     ADMIN_USERNAME = 'admin'
@@ -43,6 +93,15 @@ class Config:
     # Product Configuration
     DEFAULT_STOCK = 100
     LOW_STOCK_THRESHOLD = 5
+    PRODUCT_PAGE_SIZE = 24  # Products per page on listings and /api/products
+    PRODUCT_PAGE_SIZE_MAX = 100  # Largest page a client may ask for
+    # How often workers check whether the cached catalog or stock levels changed elsewhere
+    CATALOG_VERSION_CHECK_SECONDS = 1
+    # A stock refresh re-reads rows updated this long before the newest change it saw,
+    # so transactions that committed after a later one are still picked up
+    STOCK_REFRESH_OVERLAP_SECONDS = 60
+    CATALOG_PAYLOAD_CACHE_SIZE = 256  # Serialized API responses kept per worker
+    PRODUCT_EXPORT_CHUNK_SIZE = 1000  # Rows fetched and written per step by /api/products?stream=true
     
     # Cart Configuration
     CART_SESSION_KEY = 'cart'
@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from services.product_service import ProductService
 from services.auth_service import AuthService
 from services.order_service import OrderService
+from services.recommendation_service import recommendation_engine
 from models.database import Order
 from functools import wraps
 from werkzeug.utils import secure_filename
@@ -28,16 +29,20 @@ def admin_required(f):
 @admin_required
 def admin_panel():
     if request.method == 'POST':
-        # Update stock for products
+        # Only fields the admin edited are saved, so sales made since the page loaded are kept
+        stock_levels = {}
         for key, value in request.form.items():
             if key.startswith('stock_'):
                 product_id = int(key.split('_')[1])
                 try:
                     new_stock = int(value)
-                    ProductService.update_stock(product_id, new_stock - ProductService.get_product_by_id(product_id).stock)
-                except Exception:
+                except ValueError:
                     flash(f'Invalid stock value for product {product_id}', 'error')
-        flash('Stock values updated successfully!', 'success')
+                    continue
+                if str(new_stock) != request.form.get(f'shown_stock_{product_id}'):
+                    stock_levels[product_id] = new_stock
+        success, message = ProductService.set_stock(stock_levels)
+        flash('Stock values updated successfully!' if success else message, 'success' if success else 'error')
         return redirect(url_for('admin.admin_panel'))
     products = ProductService.get_all_products()
     low_stock_products = ProductService.get_low_stock_products()
@@ -48,7 +53,9 @@ def admin_panel():
 def update_stock(product_id):
     try:
         new_stock = int(request.form.get('quantity', 0))
-        ProductService.update_stock(product_id, new_stock - ProductService.get_product_by_id(product_id).stock)
+        success, message = ProductService.set_stock({product_id: new_stock})
+        if not success:
+            raise ValueError(message)
         flash('Stock updated successfully.', 'success')
     except Exception:
         flash('Failed to update stock.', 'error')
@@ -142,6 +149,16 @@ def admin_delete_product(product_id):
     return redirect(url_for('admin.admin_products'))
 
 # Order Management Routes
+@admin_bp.route('/admin/recommendations/reload', methods=['POST'])
+@admin_required
+def reload_recommendations():
+    """Reload the published recommendation model in this worker without blocking requests"""
+    if recommendation_engine.reload_async():
+        flash(f'Reloading recommendation model (serving version {recommendation_engine.state.version} until ready).', 'success')
+    else:
+        flash('A recommendation model reload is already in progress.', 'info')
+    return redirect(url_for('admin.admin_panel'))
+
 @admin_bp.route('/admin/orders')
 @admin_required
 def admin_orders():
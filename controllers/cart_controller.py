@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from services.cart_service import CartService
 from services.auth_service import AuthService
 from services.order_service import OrderService
+from services.product_service import ProductService
 from models.database import User  # Import the User model
 from functools import wraps
 import os
@@ -20,10 +21,12 @@ def view_cart():
 
     cart_items, total = CartService.get_cart_items(user_id)
     cart_count = CartService.get_cart_count(user_id)
+    frequently_bought = ProductService.get_frequently_bought_with([item['product_id'] for item in cart_items])
 
     return render_template('cart.html',
                          cart_items=cart_items,
                          total=total,
+                         frequently_bought=frequently_bought,
                          cart_count=cart_count)
 
 @cart_bp.route('/cart/add/<int:product_id>', methods=['POST'])
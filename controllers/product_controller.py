@@ -1,7 +1,9 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, current_app, \
+    stream_with_context
 from services.product_service import ProductService
 from services.auth_service import AuthService
 from services.cart_service import CartService
+from config import Config
 from functools import wraps
 
 product_bp = Blueprint('product', __name__)
@@ -16,6 +18,37 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def catalog_json_response(key, build):
+    """
+    JSON response for a catalog read with the catalog version as its ETag.
+    A client already holding that version gets a 304 without the body being built.
+    Without a readable version there is no ETag and every request gets the body.
+    """
+    etag = ProductService.get_catalog_etag()
+    if etag is not None and request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        etag, body = ProductService.get_catalog_payload(
+            key, lambda: current_app.json.dumps(build(), separators=(',', ':')))
+        response = current_app.response_class(body, mimetype='application/json')
+    if etag is not None:
+        response.set_etag(etag)
+    # Caches may keep the body but must revalidate it on every use
+    response.cache_control.no_cache = True
+    return response
+
+def product_summary(product):
+    """Fields of a product listed by /api/products"""
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'description': product.description,
+        'image': product.image,
+        'stock': product.stock,
+        'category': product.category
+    }
+
 def get_cart_count():
     """Helper to get cart count for logged-in users or guests."""
     user_id = session.get('user_id')
@@ -27,34 +60,46 @@ def get_cart_count():
 @product_bp.route('/')
 def index():
     """Home page with featured products"""
-    products = ProductService.get_all_products()
-    return render_template('index.html', products=products, cart_count=get_cart_count())
+    after = request.args.get('after', type=int)
+    products, next_cursor = ProductService.get_products_page(after)
+    user_id = session.get('user_id')
+    # Later pages are only fetched for their product cards
+    personalized = ProductService.get_personalized_recommendations(user_id) if user_id and after is None else []
+    return render_template('index.html', products=products, next_cursor=next_cursor,
+                           personalized=personalized, cart_count=get_cart_count())
 
 @product_bp.route('/products')
 def products():
     """Display all products"""
-    products = ProductService.get_all_products()
-    return render_template('dairy.html', products=products, cart_count=get_cart_count())
+    products, next_cursor = ProductService.get_products_page(request.args.get('after', type=int))
+    return render_template('dairy.html', products=products, next_cursor=next_cursor, cart_count=get_cart_count())
 
 @product_bp.route('/product/<int:product_id>')
 def product_detail(product_id):
     """Display product details"""
-    product = ProductService.get_product_by_id(product_id)
+    # Product, specifications and precomputed recommendations come back in one query
+    product = ProductService.get_product_with_recommendations(product_id)
     if not product:
         flash('Product not found.', 'error')
         return redirect(url_for('product.products'))
     
-    # Get ML recommendations and fetch full product details by name
-    ml_recs = ProductService.get_ml_recommendations(product.name)
-    recommendation_names = [rec['product_name'] for rec in ml_recs]
+    recommendations = [rec.rec_product for rec in product.recommendations]
     
-    # Fetch fresh product data for recommendations, excluding the current product
-    recommendations = ProductService.get_products_by_names(recommendation_names)
-    recommendations = [rec for rec in recommendations if rec.id != product_id]
+    if not recommendations:
+        # Not in the precomputed table yet: ask the model and fetch full product details by name
+        ml_recs = ProductService.get_ml_recommendations(product.name)
+        recommendation_names = [rec['product_name'] for rec in ml_recs]
+        
+        # Fetch fresh product data for recommendations, excluding the current product
+        recommendations = ProductService.get_products_by_names(recommendation_names)
+        recommendations = [rec for rec in recommendations if rec.id != product_id]
+    
+    frequently_bought = ProductService.get_frequently_bought_together(product_id)
     
     return render_template('product.html', 
                          product=product, 
                          recommendations=recommendations,
+                         frequently_bought=frequently_bought,
                          cart_count=get_cart_count())
 
 @product_bp.route('/search')
@@ -74,31 +119,163 @@ def search():
 @product_bp.route('/category/<category>')
 def category(category):
     """Display products by category"""
-    products = ProductService.get_products_by_category(category)
+    products, next_cursor = ProductService.get_products_page(request.args.get('after', type=int), category=category)
     
     return render_template('dairy.html', 
                          products=products, 
+                         next_cursor=next_cursor,
                          category=category,
                          cart_count=get_cart_count())
 
 @product_bp.route('/api/products')
 def api_products():
-    """API endpoint to get products"""
-    products = ProductService.get_all_products()
-    product_list = []
+    """API endpoint to get products, one page at a time or (with ?stream=true) all at once"""
+    if request.args.get('stream', '').lower() == 'true':
+        return stream_products(request.args.get('category'))
     
-    for product in products:
-        product_list.append({
+    try:
+        after = int(request.args['after']) if request.args.get('after') else None
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+    except ValueError:
+        return jsonify({'error': 'Cursor and limit must be integers'}), 400
+    
+    category = request.args.get('category')
+    
+    def build():
+        products, next_cursor = ProductService.get_products_page(after, limit, category)
+        return {'products': [product_summary(product) for product in products], 'next_cursor': next_cursor}
+    
+    return catalog_json_response(('products', after, limit, category), build)
+
+def stream_products(category=None):
+    """
+    The whole catalog in the paged response's shape, written chunk by chunk
+    as rows arrive, so memory stays flat however large the catalog is.
+    """
+    # Read straight from the version table: the export should not pull the catalog into the cache
+    etag = ProductService.get_catalog_etag(cached=False)
+    if etag is not None and request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    
+    dumps = current_app.json.dumps
+    
+    def generate():
+        yield '{"products":['
+        separator = ''
+        try:
+            for chunk in ProductService.iter_product_chunks(category=category):
+                yield separator + ','.join(dumps(product_summary(product), separators=(',', ':')) for product in chunk)
+                separator = ','
+        except Exception as e:
+            # The status line is already sent: abort the chunked body, leaving the JSON unterminated
+            print(f"Error streaming products: {e}")
+            raise
+        yield '],"next_cursor":null}'
+    
+    response = current_app.response_class(stream_with_context(generate()), mimetype='application/json')
+    if etag is not None:
+        response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+@product_bp.route('/api/search')
+def api_search():
+    """API endpoint to rank products by relevance to a free-text query"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'No query given'}), 400
+    
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), Config.SEARCH_RESULT_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'Limit must be an integer'}), 400
+    
+    results = [
+        {
             'id': product.id,
             'name': product.name,
             'price': product.price,
-            'description': product.description,
             'image': product.image,
-            'stock': product.stock,
-            'category': product.category
-        })
+            'category': product.category,
+            'score': score
+        } for product, score in ProductService.semantic_search(query, limit)
+    ]
+    
+    return jsonify({'query': query, 'results': results})
+
+@product_bp.route('/api/search/suggest')
+def api_search_suggest():
+    """API endpoint to autocomplete a search query from product names and categories"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'query': query, 'suggestions': []})
+    
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), Config.SEARCH_SUGGEST_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'Limit must be an integer'}), 400
     
-    return jsonify(product_list)
+    return jsonify({'query': query, 'suggestions': ProductService.suggest_products(query, limit)})
+
+@product_bp.route('/api/recommendations', methods=['GET', 'POST'])
+def api_recommendations():
+    """API endpoint to get recommendations for many products in one call"""
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            data = {}
+        product_ids = data.get('product_ids', [])
+        # A string would otherwise be read one character per id
+        if not isinstance(product_ids, list) or not all(
+                isinstance(pid, int) and not isinstance(pid, bool) for pid in product_ids):
+            return jsonify({'error': 'product_ids must be a list of integers'}), 400
+        limit = data.get('limit', 5)
+        same_category = bool(data.get('same_category', False))
+    else:
+        product_ids = request.args.get('ids', '').split(',')
+        limit = request.args.get('limit', 5)
+        same_category = request.args.get('same_category', '').lower() in ('1', 'true', 'yes')
+    
+    try:
+        product_ids = [int(pid) for pid in product_ids if str(pid).strip()]
+        limit = max(1, min(int(limit), Config.RECOMMENDATION_TOP_K))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Product ids and limit must be integers'}), 400
+    
+    if not product_ids:
+        return jsonify({'error': 'No product ids given'}), 400
+    if len(product_ids) > Config.RECOMMENDATION_BATCH_LIMIT:
+        return jsonify({'error': f'At most {Config.RECOMMENDATION_BATCH_LIMIT} products per request'}), 400
+    
+    products = ProductService.get_products_by_ids(product_ids)
+    if same_category:
+        # Each product is scored against the sub-index of its ML row's category only; the store
+        # category is free text (often empty) and need not be one of the ML categories
+        ml_recs = {p.name: ProductService.get_ml_recommendations(p.name, limit, same_category=True) for p in products}
+    else:
+        ml_recs = ProductService.get_ml_recommendations_batch([p.name for p in products], limit)
+    
+    # Resolve every recommended name to a store product in one query
+    rec_names = list(dict.fromkeys(rec['product_name'] for recs in ml_recs.values() for rec in recs))
+    rec_products = {p.name: p for p in ProductService.get_products_by_names(rec_names)}
+    
+    recommendations = {}
+    for product in products:
+        recommendations[str(product.id)] = [
+            {
+                'id': rec_products[rec['product_name']].id,
+                'name': rec_products[rec['product_name']].name,
+                'price': rec_products[rec['product_name']].price,
+                'image': rec_products[rec['product_name']].image,
+                'category': rec_products[rec['product_name']].category,
+                'similarity_score': rec['similarity_score']
+            } for rec in ml_recs.get(product.name, [])
+            if rec['product_name'] in rec_products and rec_products[rec['product_name']].id != product.id
+        ]
+    
+    return jsonify({'recommendations': recommendations})
 
 @product_bp.route('/api/product/<int:product_id>')
 def api_product_detail(product_id):
@@ -108,20 +285,21 @@ def api_product_detail(product_id):
     if not product:
         return jsonify({'error': 'Product not found'}), 404
     
-    product_data = {
-        'id': product.id,
-        'name': product.name,
-        'price': product.price,
-        'description': product.description,
-        'image': product.image,
-        'stock': product.stock,
-        'category': product.category,
-        'specifications': [
-            {
-                'feature': spec.feature,
-                'value': spec.value
-            } for spec in product.specifications
-        ]
-    }
+    def build():
+        return {
+            'id': product.id,
+            'name': product.name,
+            'price': product.price,
+            'description': product.description,
+            'image': product.image,
+            'stock': product.stock,
+            'category': product.category,
+            'specifications': [
+                {
+                    'feature': spec.feature,
+                    'value': spec.value
+                } for spec in product.specifications
+            ]
+        }
     
-    return jsonify(product_data) 
\ No newline at end of file
+    return catalog_json_response(('product', product_id), build) 
\ No newline at end of file
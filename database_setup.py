@@ -80,7 +80,9 @@ def create_tables():
                 stock INT DEFAULT 100,
                 category VARCHAR(50),
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                INDEX ix_product_category_id (category, id),
+                INDEX ix_product_updated_at (updated_at)
             )
             """
             
@@ -105,10 +107,37 @@ def create_tables():
                 description TEXT NOT NULL,
                 ingredients TEXT NOT NULL,
                 price FLOAT NOT NULL,
-                combined_features TEXT NOT NULL
+                combined_features TEXT NOT NULL,
+                store_product_id INT UNIQUE,
+                FOREIGN KEY (store_product_id) REFERENCES product(id) ON DELETE SET NULL
             )
             """
             
+            # Create product recommendation table
+            create_product_recommendation_table = """
+            CREATE TABLE IF NOT EXISTS product_recommendation (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                product_id INT NOT NULL,
+                rec_product_id INT NOT NULL,
+                `rank` INT NOT NULL,
+                score FLOAT NOT NULL,
+                UNIQUE KEY _product_rank_uc (product_id, `rank`),
+                FOREIGN KEY (product_id) REFERENCES product(id) ON DELETE CASCADE,
+                FOREIGN KEY (rec_product_id) REFERENCES product(id) ON DELETE CASCADE
+            )
+            """
+            
+            # Create catalog version table, read by every worker's catalog cache
+            create_catalog_version_table = """
+            CREATE TABLE IF NOT EXISTS catalog_version (
+                name VARCHAR(20) PRIMARY KEY,
+                version BIGINT NOT NULL
+            )
+            """
+            seed_catalog_versions = """
+            INSERT IGNORE INTO catalog_version (name, version) VALUES ('catalog', 0), ('stock', 0)
+            """
+            
             # Create feedback table
             create_feedback_table = """
             CREATE TABLE IF NOT EXISTS feedback (
@@ -133,6 +162,13 @@ def create_tables():
             cursor.execute(create_ml_product_table)
             print("ML Product table created successfully or already exists.")
             
+            cursor.execute(create_product_recommendation_table)
+            print("Product recommendation table created successfully or already exists.")
+            
+            cursor.execute(create_catalog_version_table)
+            cursor.execute(seed_catalog_versions)
+            print("Catalog version table created successfully or already exists.")
+            
             cursor.execute(create_feedback_table)
             print("Feedback table created successfully or already exists.")
             
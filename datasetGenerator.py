@@ -1,47 +1,297 @@
-import pandas as pd
+import argparse
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+import pandas as pd
 import faker
-
-# Initialize the Faker library for generating synthetic descriptions
-fake = faker.Faker()
+from config import Config
 
 # Define the products and categories
 product_names = ['Milk', 'Lassi', 'Ghee', 'Paneer', 'Shrikhand', 'Basundi', 'Cow Ghee', 'Amrkhand', 'ButterMilk', 'Dahi', 'Khawa', 'Kandhi Peda']
 categories = product_names  # Each product name is also treated as a category here
 
-# Function to generate specific ingredients based on product type
-def generate_ingredients(product):
-    base_ingredients = {
-        'Milk': 'Milk',
-        'Lassi': 'Milk, Sugar, Cardamom',
-        'Ghee': 'Clarified Butter',
-        'Paneer': 'Milk, Vinegar',
-        'Shrikhand': 'Yogurt, Sugar, Saffron, Cardamom',
-        'Basundi': 'Milk, Sugar, Nuts',
-        'Cow Ghee': 'Cow Milk Butter',
-        'Amrkhand': 'Yogurt, Mango, Sugar, Cardamom',
-        'ButterMilk': 'Milk, Cultures, Salt',
-        'Dahi': 'Milk, Live Cultures',
-        'Khawa': 'Milk Solids',
-        'Kandhi Peda': 'Milk, Sugar, Cardamom'
-    }
-    return base_ingredients.get(product, '')
-
-# Generate a dataset with 5000 rows
-num_rows = 5000
-data = {
-    'Product_ID': np.arange(1, num_rows + 1),
-    'Product_Name': np.random.choice(product_names, num_rows),
-    'Category': np.random.choice(categories, num_rows),
-    'Description': [fake.sentence() for _ in range(num_rows)],
-    'Ingredients': [generate_ingredients(product) for product in np.random.choice(product_names, num_rows)],
-    'Price': np.random.uniform(1.0, 10.0, num_rows).round(2)
+# Specific ingredients for each product type
+base_ingredients = {
+    'Milk': 'Milk',
+    'Lassi': 'Milk, Sugar, Cardamom',
+    'Ghee': 'Clarified Butter',
+    'Paneer': 'Milk, Vinegar',
+    'Shrikhand': 'Yogurt, Sugar, Saffron, Cardamom',
+    'Basundi': 'Milk, Sugar, Nuts',
+    'Cow Ghee': 'Cow Milk Butter',
+    'Amrkhand': 'Yogurt, Mango, Sugar, Cardamom',
+    'ButterMilk': 'Milk, Cultures, Salt',
+    'Dahi': 'Milk, Live Cultures',
+    'Khawa': 'Milk Solids',
+    'Kandhi Peda': 'Milk, Sugar, Cardamom'
 }
 
-# Create DataFrame
-df = pd.DataFrame(data)
+# Store images shipped in static/images for each product type
+product_images = {
+    'Milk': 'milk.jpg', 'Lassi': 'lassi.jpg', 'Ghee': 'Ghee.jpg', 'Paneer': 'Paneer.jpg',
+    'Shrikhand': 'Shrikhand.JPG', 'Basundi': 'Basundi.jpg', 'Cow Ghee': 'CowGhee.jpg',
+    'Amrkhand': 'Amrkhand.jpg', 'ButterMilk': 'ButterMilk.jpg', 'Dahi': 'dahi.jpg',
+    'Khawa': 'khawa.jpg', 'Kandhi Peda': 'kandhi Peda.jpg'
+}
+
+order_statuses = np.array(['Pending Verification', 'Approved', 'Rejected'])
+order_status_weights = [0.2, 0.7, 0.1]
+
+# Faker output is drawn once into pools; rows then sample pool indices with NumPy
+SENTENCE_POOL_SIZE = 5000
+PERSON_POOL_SIZE = 2000
+MAX_ITEMS_PER_ORDER = 5
+MAX_ITEMS_PER_CART = 4
+# Product popularity follows a Zipf-like curve so co-purchase counts have structure
+POPULARITY_EXPONENT = 1.1
+# Order timestamps are spread over the year before this date, independent of when the script runs
+ORDER_DATES_END = np.datetime64('2024-12-31T23:59:59')
+
+# Pools and shared arrays for the process generating chunks
+_context = None
+
+def build_context(args):
+    """Everything chunk workers share: faker pools, product prices and popularity"""
+    fake = faker.Faker()
+    fake.seed_instance(args.seed)
+    # Indian names and addresses to match the store
+    people = faker.Faker('en_IN')
+    people.seed_instance(args.seed)
+    rng = np.random.default_rng([args.seed, 0])
+
+    prices = rng.uniform(1.0, 10.0, args.products).round(2)
+    popularity = 1.0 / np.arange(1, args.products + 1) ** POPULARITY_EXPONENT
+    popularity_cdf = np.cumsum(rng.permutation(popularity))
+    return {
+        'sentences': np.array([fake.sentence() for _ in range(SENTENCE_POOL_SIZE)], dtype=object),
+        'first_names': np.array([people.first_name() for _ in range(PERSON_POOL_SIZE)], dtype=object),
+        'last_names': np.array([people.last_name() for _ in range(PERSON_POOL_SIZE)], dtype=object),
+        'addresses': np.array([people.address().replace('\n', ', ') for _ in range(PERSON_POOL_SIZE)], dtype=object),
+        'password_hash': password_hash('password', f'seed{args.seed}'),
+        'prices': prices,
+        'popularity_cdf': popularity_cdf / popularity_cdf[-1],
+        'n_products': args.products,
+        'n_users': args.users,
+        'seed': args.seed,
+        'format': args.format,
+        'out_dir': args.out_dir,
+        'tables': args.tables
+    }
+
+def password_hash(password, salt, iterations=600000):
+    """Werkzeug-compatible pbkdf2 hash with a fixed salt, so the same seed gives the same users file"""
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), iterations).hex()
+    return f'pbkdf2:sha256:{iterations}${salt}${digest}'
+
+def _init_worker(context):
+    global _context
+    _context = context
+
+def _pick(pool, rng, n):
+    return pool[rng.integers(0, len(pool), n)]
+
+def _popular_products(rng, n):
+    """Product ids (1-based) sampled by popularity"""
+    rows = np.searchsorted(_context['popularity_cdf'], rng.random(n), side='right')
+    return np.minimum(rows, _context['n_products'] - 1) + 1
+
+def _repeat_ids(ids, counts, start, max_per_parent):
+    """Child rows for each parent id, with ids that stay unique across chunks"""
+    parent_ids = np.repeat(ids, counts)
+    # Each chunk owns ids from its first parent * max_per_parent upwards, so chunks never collide
+    child_ids = start * max_per_parent + np.arange(len(parent_ids)) + 1
+    return child_ids, parent_ids
+
+def catalog_chunk(start, stop, rng):
+    """ML products and the matching store products for ids start+1..stop"""
+    names = np.array(product_names, dtype=object)
+    n = stop - start
+    ids = np.arange(start + 1, stop + 1)
+    product_name = _pick(names, rng, n)
+    description = _pick(_context['sentences'], rng, n)
+    ml_products = pd.DataFrame({
+        'Product_ID': ids,
+        'Product_Name': product_name,
+        'Category': _pick(names, rng, n),
+        'Description': description,
+        'Ingredients': pd.Series(_pick(names, rng, n)).map(base_ingredients).to_numpy(),
+        'Price': _context['prices'][start:stop]
+    })
+    products = pd.DataFrame({
+        'id': ids,
+        'name': product_name,
+        'price': _context['prices'][start:stop],
+        'description': description,
+        'image': pd.Series(product_name).map(product_images).to_numpy(),
+        'stock': rng.integers(0, 500, n),
+        'category': 'Dairy'
+    })
+    return {'ml_products': ml_products, 'products': products}
+
+def users_chunk(start, stop, rng):
+    n = stop - start
+    ids = np.arange(start + 1, stop + 1)
+    users = pd.DataFrame({
+        'id': ids,
+        'username': [f'user{i}' for i in ids],
+        'email': [f'user{i}@example.com' for i in ids],
+        'password_hash': _context['password_hash'],
+        'first_name': _pick(_context['first_names'], rng, n),
+        'last_name': _pick(_context['last_names'], rng, n),
+        'phone': rng.integers(6_000_000_000, 10_000_000_000, n).astype(str),
+        'address': _pick(_context['addresses'], rng, n),
+        'is_active': True,
+        'user_type': 'user'
+    })
+    return {'users': users}
+
+def carts_chunk(start, stop, rng):
+    """Carts start+1..stop, owned by the users with the same ids"""
+    ids = np.arange(start + 1, stop + 1)
+    counts = rng.integers(1, MAX_ITEMS_PER_CART + 1, len(ids))
+    item_ids, cart_ids = _repeat_ids(ids, counts, start, MAX_ITEMS_PER_CART)
+    carts = pd.DataFrame({'id': ids, 'user_id': ids})
+    cart_items = pd.DataFrame({
+        'id': item_ids,
+        'cart_id': cart_ids,
+        'product_id': _popular_products(rng, len(item_ids)),
+        'quantity': rng.integers(1, 4, len(item_ids))
+    })
+    return {'carts': carts, 'cart_items': cart_items}
+
+def orders_chunk(start, stop, rng):
+    n = stop - start
+    ids = np.arange(start + 1, stop + 1)
+    counts = rng.integers(1, MAX_ITEMS_PER_ORDER + 1, n)
+    item_ids, order_ids = _repeat_ids(ids, counts, start, MAX_ITEMS_PER_ORDER)
+    product_ids = _popular_products(rng, len(item_ids))
+    quantities = rng.integers(1, 4, len(item_ids))
+    prices = _context['prices'][product_ids - 1]
+    totals = np.bincount(order_ids - start - 1, weights=prices * quantities, minlength=n).round(2)
+    seconds_before_end = rng.integers(0, 365 * 24 * 3600, n)
+
+    orders = pd.DataFrame({
+        'id': ids,
+        'user_id': rng.integers(1, _context['n_users'] + 1, n),
+        'total_amount': totals,
+        'status': order_statuses[rng.choice(len(order_statuses), n, p=order_status_weights)],
+        'shipping_address': _pick(_context['addresses'], rng, n),
+        'created_at': ORDER_DATES_END - seconds_before_end.astype('timedelta64[s]')
+    })
+    order_items = pd.DataFrame({
+        'id': item_ids,
+        'order_id': order_ids,
+        'product_id': product_ids,
+        'quantity': quantities,
+        'price': prices
+    })
+    return {'orders': orders, 'order_items': order_items}
+
+GENERATORS = {'catalog': catalog_chunk, 'users': users_chunk, 'carts': carts_chunk, 'orders': orders_chunk}
+
+def output_path(out_dir, table, fmt, csv_name=None):
+    if fmt == 'parquet':
+        return os.path.join(out_dir, table)
+    return os.path.join(out_dir, csv_name or f'{table}.csv')
+
+def generate_chunk(kind, chunk, start, stop):
+    """Generate one chunk; parquet parts are written here, CSV text goes back to be appended in order"""
+    # Seeded per (kind, chunk) so output does not depend on the number of workers
+    rng = np.random.default_rng([_context['seed'], list(GENERATORS).index(kind) + 1, chunk])
+    frames = {table: frame for table, frame in GENERATORS[kind](start, stop, rng).items()
+              if table in _context['tables']}
+    if _context['format'] == 'parquet':
+        for table, frame in frames.items():
+            directory = output_path(_context['out_dir'], table, 'parquet')
+            frame.to_parquet(os.path.join(directory, f'part-{chunk:05d}.parquet'), index=False)
+        return {}
+    return {table: frame.to_csv(index=False, header=chunk == 0) for table, frame in frames.items()}
+
+def chunk_jobs(kind, total, chunk_size):
+    return [(kind, i, start, min(start + chunk_size, total)) for i, start in enumerate(range(0, total, chunk_size))]
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic catalog, users, carts and orders')
+    parser.add_argument('--products', type=int, default=5000, help='ML products (and store products) to generate')
+    parser.add_argument('--users', type=int, default=0, help='Users to generate (password: "password")')
+    parser.add_argument('--carts', type=int, default=0, help='Carts to generate, one each for the first users')
+    parser.add_argument('--orders', type=int, default=0, help='Orders to generate')
+    parser.add_argument('--chunk-size', type=int, default=100000, help='Rows generated and written per chunk')
+    parser.add_argument('--workers', type=int, default=1, help='Processes generating chunks')
+    parser.add_argument('--seed', type=int, default=42, help='Seed; the same seed gives the same files')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                        help='One CSV per table, or a directory of parquet parts per table')
+    parser.add_argument('--out-dir', default=None,
+                        help='Where to write the tables; giving it also writes store products (default: .)')
+    parser.add_argument('--store-products', action='store_true',
+                        help='Also write store products (products.csv) when no --out-dir is given')
+    parser.add_argument('--ml-products-csv', default=os.path.basename(Config.ML_PRODUCTS_CSV),
+                        help='File name for the ML products CSV read by modelTrainning.py')
+    args = parser.parse_args()
+
+    if args.carts > args.users:
+        parser.error('--carts cannot exceed --users (each cart belongs to a different user)')
+    if (args.carts or args.orders) and not (args.users and args.products):
+        parser.error('--carts and --orders need --users and --products')
+    if args.format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error('--format parquet needs the pyarrow package')
+
+    # Store products would replace the repo's own products.csv, so they need --out-dir or an explicit flag
+    write_store_products = args.out_dir is not None or args.store_products
+    args.out_dir = args.out_dir or '.'
+
+    started = time.perf_counter()
+    os.makedirs(args.out_dir, exist_ok=True)
+    jobs = (chunk_jobs('catalog', args.products, args.chunk_size) + chunk_jobs('users', args.users, args.chunk_size)
+            + chunk_jobs('carts', args.carts, args.chunk_size) + chunk_jobs('orders', args.orders, args.chunk_size))
+    tables = {'catalog': ['ml_products', 'products'], 'users': ['users'], 'carts': ['carts', 'cart_items'],
+              'orders': ['orders', 'order_items']}
+    produced = [table for kind in dict.fromkeys(job[0] for job in jobs) for table in tables[kind]
+                if table != 'products' or write_store_products]
+    args.tables = set(produced)
+    csv_names = {'ml_products': args.ml_products_csv}
+
+    files = {}
+    for table in produced:
+        path = output_path(args.out_dir, table, args.format, csv_names.get(table))
+        if args.format == 'parquet':
+            os.makedirs(path, exist_ok=True)
+        else:
+            files[table] = open(path, 'w', newline='')
+
+    context = build_context(args)
+
+    def collect(result):
+        for table, text in result.items():
+            files[table].write(text)
+
+    try:
+        if args.workers <= 1:
+            _init_worker(context)
+            for job in jobs:
+                collect(generate_chunk(*job))
+        else:
+            with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(context,)) as pool:
+                # Keep a bounded window in flight so finished CSV chunks are written in order without piling up
+                window = args.workers * 2
+                futures = [pool.submit(generate_chunk, *job) for job in jobs[:window]]
+                for i in range(len(jobs)):
+                    collect(futures[i].result())
+                    futures[i] = None
+                    if i + window < len(jobs):
+                        futures.append(pool.submit(generate_chunk, *jobs[i + window]))
+    finally:
+        for f in files.values():
+            f.close()
 
-# Save to CSV
-df.to_csv('dairy_products_large.csv', index=False)
+    for table in produced:
+        print(f"{table}: written to {output_path(args.out_dir, table, args.format, csv_names.get(table))}")
+    print(f"Generated {len(jobs)} chunks in {time.perf_counter() - started:.2f}s")
 
-print("Large dataset generated and saved as 'dairy_products_large.csv'.")
+if __name__ == '__main__':
+    main()
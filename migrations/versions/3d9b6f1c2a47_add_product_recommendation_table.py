@@ -0,0 +1,34 @@
+"""Add product_recommendation table
+
+Revision ID: 3d9b6f1c2a47
+Revises: fc31fc2683ee
+Create Date: 2026-10-17 01:40:12.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d9b6f1c2a47'
+down_revision = 'fc31fc2683ee'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('product_recommendation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('rec_product_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['rec_product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('product_id', 'rank', name='_product_rank_uc')
+    )
+
+
+def downgrade():
+    op.drop_table('product_recommendation')
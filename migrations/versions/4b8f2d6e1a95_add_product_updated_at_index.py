@@ -0,0 +1,26 @@
+"""Add an updated_at index for incremental stock refreshes
+
+Revision ID: 4b8f2d6e1a95
+Revises: 9e41b7c3d2f8
+Create Date: 2026-10-17 03:12:44.180263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b8f2d6e1a95'
+down_revision = '9e41b7c3d2f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.create_index('ix_product_updated_at', ['updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_updated_at')
@@ -0,0 +1,31 @@
+"""Link ML catalog rows to the store products they were written for
+
+Revision ID: 6d3a9c1e7f42
+Revises: 4b8f2d6e1a95
+Create Date: 2026-10-17 04:05:31.527904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6d3a9c1e7f42'
+down_revision = '4b8f2d6e1a95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('ml_product', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('store_product_id', sa.Integer(), nullable=True))
+        batch_op.create_unique_constraint('uq_ml_product_store_product_id', ['store_product_id'])
+        batch_op.create_foreign_key('fk_ml_product_store_product_id', 'product', ['store_product_id'], ['id'],
+                                    ondelete='SET NULL')
+
+
+def downgrade():
+    with op.batch_alter_table('ml_product', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_ml_product_store_product_id', type_='foreignkey')
+        batch_op.drop_constraint('uq_ml_product_store_product_id', type_='unique')
+        batch_op.drop_column('store_product_id')
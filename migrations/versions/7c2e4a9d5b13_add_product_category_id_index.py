@@ -0,0 +1,26 @@
+"""Add a (category, id) index for paginated category listings
+
+Revision ID: 7c2e4a9d5b13
+Revises: 3d9b6f1c2a47
+Create Date: 2026-10-17 02:05:31.904117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2e4a9d5b13'
+down_revision = '3d9b6f1c2a47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.create_index('ix_product_category_id', ['category', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_category_id')
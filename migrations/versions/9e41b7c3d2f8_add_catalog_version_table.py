@@ -0,0 +1,32 @@
+"""Add catalog_version table
+
+Revision ID: 9e41b7c3d2f8
+Revises: 7c2e4a9d5b13
+Create Date: 2026-10-17 02:31:07.552914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e41b7c3d2f8'
+down_revision = '7c2e4a9d5b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    catalog_version = op.create_table('catalog_version',
+    sa.Column('name', sa.String(length=20), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(catalog_version, [
+        {'name': 'catalog', 'version': 0},
+        {'name': 'stock', 'version': 0}
+    ])
+
+
+def downgrade():
+    op.drop_table('catalog_version')
@@ -1,29 +1,236 @@
-import pickle
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import argparse
+import resource
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.feature_extraction.text import TfidfVectorizer, ENGLISH_STOP_WORDS
+from sklearn.preprocessing import normalize
+import numpy as np
 import pandas as pd
+from sqlalchemy import select
+from config import Config
+from models.database import db, MLProduct, Product
+from services.similarity import top_k_neighbors
+from services.ann_index import LSHIndex, recall_report
+from services.text_vectorizer import CompactTfidfVectorizer, HashingTfidfVectorizer
+from services import ml_artifacts
 
-# Load the dataset
-df = pd.read_csv('dairy_products_large.csv')
+# Upper bound on the similarity block each process materializes at once
+BLOCK_MEMORY_MB = 256
+# Sparse product (value + index) + dense copy + top-K working copy, per entry
+BYTES_PER_SIMILARITY = 20
 
-# Combine 'Description' and 'Ingredients' for feature extraction
-df['Combined_Features'] = df['Description'] + ' ' + df['Ingredients']
+# Normalized TF-IDF matrix shared with pool workers
+_worker_matrix = None
 
-# Initialize TF-IDF Vectorizer
-tfidf_vectorizer = TfidfVectorizer(stop_words='english')
+def _init_worker(matrix):
+    global _worker_matrix
+    _worker_matrix = matrix
 
-# Fit and transform the 'Combined_Features' column
-tfidf_matrix = tfidf_vectorizer.fit_transform(df['Combined_Features'])
+def _neighbor_block(start, stop, k, matrix=None):
+    """Top-K neighbors of rows start..stop against the whole matrix"""
+    matrix = _worker_matrix if matrix is None else matrix
+    # Rows are L2-normalized, so the dot product is the cosine similarity
+    sim_block = (matrix[start:stop] @ matrix.T).toarray()
+    indices, scores = top_k_neighbors(sim_block, k, row_offset=start)
+    return start, stop, indices, scores
 
-# Compute similarity matrix
-cosine_sim = cosine_similarity(tfidf_matrix, tfidf_matrix)
+def default_block_size(n_rows):
+    """Rows per block so one dense block stays under BLOCK_MEMORY_MB"""
+    return max(1, min(4096, BLOCK_MEMORY_MB * 1024 * 1024 // (BYTES_PER_SIMILARITY * max(n_rows, 1))))
 
-# Save the TF-IDF Vectorizer and similarity matrix
-with open('tfidf_vectorizer.pkl', 'wb') as f:
-    pickle.dump(tfidf_vectorizer, f)
+def normalize_matrix(tfidf_matrix):
+    """float32 CSR with unit-length rows, as stored in the artifacts"""
+    return normalize(tfidf_matrix.tocsr().astype(np.float32), norm='l2')
 
-with open('cosine_sim.pkl', 'wb') as f:
-    pickle.dump(cosine_sim, f)
+def build_neighbor_table(tfidf_matrix, top_k, out_indices, out_scores, workers=1, block_size=None):
+    """
+    Fill ``out_indices``/``out_scores`` with each row's top-K most similar rows.
 
-# Save the dataset
-df.to_csv('dairy_products_large.csv', index=False)
+    Similarities are computed one row block at a time, so peak memory is one
+    dense block per process rather than the full N x N matrix. Finished
+    blocks are written straight into the (memory-mapped) output arrays.
+    """
+    matrix = normalize_matrix(tfidf_matrix)
+    n_rows = matrix.shape[0]
+    k = out_indices.shape[1]
+    block_size = block_size or default_block_size(n_rows)
+    blocks = [(start, min(start + block_size, n_rows)) for start in range(0, n_rows, block_size)]
+
+    if workers <= 1:
+        results = (_neighbor_block(start, stop, k, matrix) for start, stop in blocks)
+        for start, stop, indices, scores in results:
+            out_indices[start:stop], out_scores[start:stop] = indices, scores
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(matrix,)) as pool:
+        futures = [pool.submit(_neighbor_block, start, stop, k) for start, stop in blocks]
+        for future in futures:
+            start, stop, indices, scores = future.result()
+            out_indices[start:stop], out_scores[start:stop] = indices, scores
+
+def fit_vectorizer(texts, args):
+    """Fit the configured vectorizer in one pass over ``texts``; return it with the TF-IDF rows"""
+    if args.vectorizer == 'hashing':
+        # No vocabulary: tokens hash to a fixed number of columns, weighted by per-column IDF
+        return HashingTfidfVectorizer.fit_transform(texts, args.hashing_features, stop_words=ENGLISH_STOP_WORDS)
+
+    # Initialize TF-IDF Vectorizer
+    tfidf_vectorizer = TfidfVectorizer(stop_words='english')
+
+    # Fit and transform; scikit-learn reads any iterable of documents in a single pass
+    tfidf_matrix = tfidf_vectorizer.fit_transform(texts)
+    return CompactTfidfVectorizer.from_sklearn(tfidf_vectorizer), tfidf_matrix
+
+def read_csv_dataset(csv_path):
+    """Product ids and combined feature text from the ML product CSV"""
+    # Load the dataset
+    df = pd.read_csv(csv_path)
+
+    # Combine 'Description' and 'Ingredients' for feature extraction
+    df['Combined_Features'] = df['Description'] + ' ' + df['Ingredients']
+
+    # Save the dataset
+    df.to_csv(csv_path, index=False)
+    return df['Product_ID'].to_numpy(dtype=np.int64), df['Combined_Features']
+
+def add_missing_store_products():
+    """Give store products with no linked ML catalog row one, so the model covers the live catalog"""
+    linked = select(MLProduct.store_product_id).where(MLProduct.store_product_id.isnot(None))
+    missing = db.session.query(Product.id, Product.name, Product.category, Product.description, Product.price)\
+        .filter(~Product.id.in_(linked))\
+        .order_by(Product.id)\
+        .all()
+    next_id = (db.session.query(db.func.max(MLProduct.product_id)).scalar() or 0) + 1
+    # One row per store product, even where its name matches ML rows or other store products
+    db.session.add_all([
+        MLProduct(product_id=next_id + i, store_product_id=store_id, product_name=name,
+                  category=category if category and category != 'None' else '',
+                  description=description, ingredients='', price=price,
+                  combined_features=description)
+        for i, (store_id, name, category, description, price) in enumerate(missing)
+    ])
+    db.session.commit()
+    return len(missing)
+
+def stream_ml_products(product_ids, chunk_size):
+    """Yield every MLProduct's feature text, fetched chunk_size rows at a time, recording its product_id"""
+    rows = db.session.query(MLProduct.product_id, MLProduct.combined_features)\
+        .order_by(MLProduct.id)\
+        .yield_per(chunk_size)
+    for product_id, combined_features in rows:
+        product_ids.append(product_id)
+        yield combined_features or ''
+
+def fit_from_database(args):
+    """Stream the ML catalog from the database into the vectorizer without building a DataFrame"""
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        if args.include_store_products:
+            print(f"Added {add_missing_store_products()} store products to the ML catalog")
+        product_ids = array('q')
+        vectorizer, tfidf_matrix = fit_vectorizer(stream_ml_products(product_ids, args.chunk_size), args)
+    return np.frombuffer(product_ids, dtype=np.int64), vectorizer, tfidf_matrix
+
+def write_recommendation_table():
+    """Store each store product's recommendations from the just-published model"""
+    from app import create_app
+    from services.product_service import ProductService
+    from services.recommendation_service import recommendation_engine
+
+    app = create_app()
+    with app.app_context():
+        recommendation_engine.load()
+        success, message = ProductService.rebuild_recommendation_table()
+        print(message)
+
+def peak_rss_mb():
+    """Peak resident memory of this process and of its finished children, in MB"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return own, children
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the product recommendation model')
+    parser.add_argument('--source', choices=['csv', 'db'], default='csv',
+                        help='Read the ML catalog from the CSV, or stream it from the database')
+    parser.add_argument('--csv', default=Config.ML_PRODUCTS_CSV, help='ML product dataset')
+    parser.add_argument('--chunk-size', type=int, default=Config.TRAINING_CHUNK_SIZE,
+                        help='Rows fetched per database round trip with --source db')
+    parser.add_argument('--include-store-products', action='store_true',
+                        help='With --source db, first add store products missing from the ML catalog')
+    parser.add_argument('--top-k', type=int, default=Config.RECOMMENDATION_TOP_K,
+                        help='Neighbors kept per product')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Processes used to compute similarity blocks')
+    parser.add_argument('--block-size', type=int, default=None,
+                        help=f'Rows per similarity block (default: fit in {BLOCK_MEMORY_MB} MB)')
+    parser.add_argument('--vectorizer', choices=['tfidf', 'hashing'], default=Config.RECOMMENDATION_VECTORIZER,
+                        help='Fitted vocabulary, or stateless hashed columns')
+    parser.add_argument('--hashing-features', type=int, default=Config.HASHING_FEATURES,
+                        help='Columns used by the hashing vectorizer')
+    parser.add_argument('--ann', action='store_true',
+                        help='Also build the approximate nearest-neighbor (LSH) index')
+    parser.add_argument('--ann-tables', type=int, default=Config.ANN_TABLES, help='LSH hash tables')
+    parser.add_argument('--ann-bits', type=int, default=Config.ANN_BITS,
+                        help='Hyperplanes per LSH table (default: derived from the catalog size)')
+    parser.add_argument('--ann-report', action='store_true',
+                        help='Report LSH recall@K and query time against the exact neighbors')
+    parser.add_argument('--write-db', action='store_true',
+                        help='Also rewrite the product_recommendation table from the new model')
+    args = parser.parse_args()
+    started = time.perf_counter()
+    # Training only borrows the app for its database session; it never searches
+    Config.SEARCH_PRELOAD = False
+
+    if args.source == 'db':
+        product_ids, vectorizer, tfidf_matrix = fit_from_database(args)
+    else:
+        product_ids, texts = read_csv_dataset(args.csv)
+        vectorizer, tfidf_matrix = fit_vectorizer(texts, args)
+        del texts
+    n_rows = tfidf_matrix.shape[0]
+    k = max(0, min(args.top_k, n_rows - 1))
+
+    # Stream each block's top-K neighbors into a new artifact version
+    version_dir = ml_artifacts.new_version_dir(Config.ML_ARTIFACTS_DIR)
+    indices = ml_artifacts.open_array(version_dir, 'neighbor_indices', (n_rows, k), np.int32)
+    scores = ml_artifacts.open_array(version_dir, 'neighbor_scores', (n_rows, k), np.float32)
+    build_neighbor_table(tfidf_matrix, k, indices, scores, workers=args.workers, block_size=args.block_size)
+    indices.flush()
+    scores.flush()
+
+    # Keep the normalized vectors for query-time scoring
+    matrix = normalize_matrix(tfidf_matrix)
+    ml_artifacts.save_sparse(version_dir, 'tfidf', matrix)
+
+    if args.ann or args.ann_report:
+        ann_index = LSHIndex.build(matrix, n_tables=args.ann_tables, n_bits=args.ann_bits)
+        ann_index.save(version_dir)
+        if args.ann_report:
+            report = recall_report(ann_index, matrix, indices, min(k, 10))
+            print(f"LSH {report['n_tables']} tables x {report['n_bits']} bits: "
+                  f"recall@{report['k']} = {report['recall']:.3f}, "
+                  f"{report['mean_query_ms']:.3f} ms/query, {report['mean_candidates']:.0f} candidates "
+                  f"over {report['queries']} queries")
+    del indices, scores
+
+    vectorizer.save(version_dir)
+    ml_artifacts.save_array(version_dir, 'product_ids', product_ids)
+
+    # Switch running workers over to the new version, never in the middle of an incremental update's publish
+    with ml_artifacts.publish_lock(Config.ML_ARTIFACTS_DIR):
+        version = ml_artifacts.publish(Config.ML_ARTIFACTS_DIR, version_dir, keep=Config.ML_ARTIFACTS_KEEP)
+    print(f"Published top-{k} neighbors for {n_rows} products as version {version}")
+
+    if args.write_db:
+        write_recommendation_table()
+
+    own_mb, children_mb = peak_rss_mb()
+    print(f"Wall time: {time.perf_counter() - started:.2f}s, "
+          f"peak RSS: {own_mb:.0f} MB (main), {children_mb:.0f} MB (largest worker)")
+
+if __name__ == '__main__':
+    main()
@@ -32,9 +32,17 @@ class Product(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Category listings page through products by id; caches pick up recent edits by updated_at
+    __table_args__ = (db.Index('ix_product_category_id', 'category', 'id'),
+                      db.Index('ix_product_updated_at', 'updated_at'))
+    
     # Relationship with product specifications
     specifications = db.relationship('ProductSpecification', backref='product', lazy=True, cascade='all, delete-orphan')
     
+    # Precomputed recommendations, best first
+    recommendations = db.relationship('ProductRecommendation', foreign_keys='ProductRecommendation.product_id',
+                                      order_by='ProductRecommendation.rank', lazy=True, cascade='all, delete-orphan')
+    
     def __repr__(self):
         return f'<Product {self.name}>'
 
@@ -48,10 +56,38 @@ class ProductSpecification(db.Model):
     def __repr__(self):
         return f'<ProductSpecification {self.feature}: {self.value}>'
 
+class CatalogVersion(db.Model):
+    """Change counter for one part of the catalog ('catalog' or 'stock'), shared by every worker"""
+    __tablename__ = 'catalog_version'
+    name = db.Column(db.String(20), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<CatalogVersion {self.name}: {self.version}>'
+
+class ProductRecommendation(db.Model):
+    """Precomputed recommendation of one product for another, written by model training"""
+    __tablename__ = 'product_recommendation'
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), nullable=False)
+    rec_product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), nullable=False)
+    rank = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    # One row per rank per product; also the index the product page reads through
+    __table_args__ = (db.UniqueConstraint('product_id', 'rank', name='_product_rank_uc'),)
+
+    rec_product = db.relationship('Product', foreign_keys=[rec_product_id])
+
+    def __repr__(self):
+        return f'<ProductRecommendation {self.product_id} -> {self.rec_product_id} (#{self.rank})>'
+
 class MLProduct(db.Model):
     """ML Product model for recommendation system"""
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, nullable=False)
+    # The store product this row was written for, if any; synthetic rows share names with store products
+    store_product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='SET NULL'), nullable=True, unique=True)
     product_name = db.Column(db.String(100), nullable=False)
     category = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=False)
@@ -0,0 +1,139 @@
+from services import ml_artifacts
+import numpy as np
+import math
+import time
+
+# Above this share of the catalog, candidates are scored with one full scan instead
+EXACT_SCAN_FRACTION = 0.2
+
+# Rows per bucket aimed for when the hyperplane count is derived from the catalog size
+TARGET_BUCKET_ROWS = 64
+MAX_BITS = 20
+
+def bits_for_rows(n_rows, bucket_rows=TARGET_BUCKET_ROWS):
+    """
+    Hyperplanes per table that leave about ``bucket_rows`` rows in a bucket.
+
+    A fixed count does not fit every catalog: 12 bits over 5,000 products
+    leaves one or two rows per bucket and recall@10 near 0.03, while the same
+    12 bits suit 100,000 near-duplicate ones.
+    """
+    return int(min(MAX_BITS, max(1, math.floor(math.log2(max(n_rows, 1) / bucket_rows)))))
+
+class LSHIndex:
+    """
+    Random-projection LSH over L2-normalized TF-IDF rows.
+
+    Each of ``n_tables`` tables hashes a vector to ``n_bits`` sign bits of its
+    projection onto random hyperplanes, so rows with a small angle between
+    them tend to share a bucket. A query collects the rows in its buckets and
+    re-scores only those candidates exactly.
+    """
+
+    def __init__(self, planes, table_keys, table_rows):
+        self.planes = planes
+        self.table_keys = table_keys
+        self.table_rows = table_rows
+        self.n_tables = table_keys.shape[0]
+        self.n_bits = planes.shape[1] // self.n_tables
+        self._powers = (1 << np.arange(self.n_bits, dtype=np.uint64)).astype(np.uint64)
+
+    @classmethod
+    def build(cls, matrix, n_tables=16, n_bits=None, seed=0):
+        """Hash every row of ``matrix`` into ``n_tables`` sorted bucket tables; ``n_bits`` defaults to bits_for_rows"""
+        n_bits = n_bits or bits_for_rows(matrix.shape[0])
+        rng = np.random.default_rng(seed)
+        planes = rng.standard_normal((matrix.shape[1], n_tables * n_bits)).astype(np.float32)
+        index = cls(planes, np.empty((n_tables, 0), dtype=np.uint64), np.empty((n_tables, 0), dtype=np.int32))
+
+        keys = index.hash(matrix)
+        table_rows = np.argsort(keys, axis=0, kind='stable').T.astype(np.int32)
+        table_keys = np.take_along_axis(keys.T, table_rows.astype(np.int64), axis=1)
+        return cls(planes, table_keys, table_rows)
+
+    def hash(self, vectors):
+        """Bucket keys of shape (n_vectors, n_tables)"""
+        projected = np.asarray(vectors @ self.planes)
+        bits = (projected > 0).reshape(-1, self.n_tables, self.n_bits).astype(np.uint64)
+        return bits @ self._powers
+
+    def candidates(self, vector, min_candidates=0):
+        """Rows sharing a bucket with ``vector``, probing neighbouring buckets if too few"""
+        keys = self.hash(vector)[0]
+        found = [self._bucket(t, key) for t, key in enumerate(keys)]
+        if sum(len(rows) for rows in found) < min_candidates:
+            # Multi-probe: flip one bit at a time
+            for t, key in enumerate(keys):
+                for bit in self._powers:
+                    found.append(self._bucket(t, key ^ bit))
+        if not found:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate(found))
+
+    def _bucket(self, table, key):
+        keys = self.table_keys[table]
+        lo = np.searchsorted(keys, key, side='left')
+        hi = np.searchsorted(keys, key, side='right')
+        return self.table_rows[table, lo:hi]
+
+    def query(self, vector, matrix, k, exclude=None):
+        """Approximate top-k rows of ``matrix`` by cosine similarity to ``vector``"""
+        rows = self.candidates(vector, min_candidates=k + 1)
+        dense_vector = vector.toarray().ravel() if hasattr(vector, 'toarray') else np.asarray(vector).ravel()
+        if len(rows) > matrix.shape[0] * EXACT_SCAN_FRACTION:
+            # Gathering that many sparse rows costs more than scoring them all
+            rows = np.arange(matrix.shape[0])
+            scores = matrix @ dense_vector
+        else:
+            scores = matrix[rows] @ dense_vector
+        if exclude is not None and len(rows):
+            keep = ~np.isin(rows, exclude)
+            rows, scores = rows[keep], scores[keep]
+        if not len(rows) or k <= 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        scores = scores.astype(np.float32)
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        return rows[order], scores[order]
+
+    def save(self, version_dir):
+        ml_artifacts.save_array(version_dir, 'lsh_planes', self.planes)
+        ml_artifacts.save_array(version_dir, 'lsh_keys', self.table_keys)
+        ml_artifacts.save_array(version_dir, 'lsh_rows', self.table_rows)
+
+    @classmethod
+    def load(cls, version_dir):
+        """Memory-map a saved index, or return None if the version has none"""
+        planes = ml_artifacts.load_array(version_dir, 'lsh_planes')
+        table_keys = ml_artifacts.load_array(version_dir, 'lsh_keys')
+        table_rows = ml_artifacts.load_array(version_dir, 'lsh_rows')
+        if planes is None or table_keys is None or table_rows is None:
+            return None
+        return cls(planes, table_keys, table_rows)
+
+def recall_report(index, matrix, exact_indices, k, sample_size=1000, seed=0):
+    """Recall@k and mean query time of ``index`` against the exact neighbor table"""
+    rng = np.random.default_rng(seed)
+    n_rows = matrix.shape[0]
+    sample = rng.choice(n_rows, size=min(sample_size, n_rows), replace=False)
+    hits, total, elapsed, candidates = 0, 0, 0.0, 0
+    for row in sample:
+        started = time.perf_counter()
+        found, _ = index.query(matrix[row], matrix, k, exclude=[row])
+        elapsed += time.perf_counter() - started
+        candidates += len(index.candidates(matrix[row], min_candidates=k + 1))
+        expected = np.asarray(exact_indices[row, :k])
+        hits += len(np.intersect1d(found, expected))
+        total += len(expected)
+    return {
+        'k': k,
+        'n_tables': index.n_tables,
+        'n_bits': index.n_bits,
+        'queries': len(sample),
+        'recall': hits / total if total else 0.0,
+        'mean_query_ms': elapsed / len(sample) * 1e3 if len(sample) else 0.0,
+        'mean_candidates': candidates / len(sample) if len(sample) else 0.0
+    }
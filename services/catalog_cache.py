@@ -0,0 +1,252 @@
+from models.database import db, Product, CatalogVersion
+from sqlalchemy.orm import selectinload
+from sqlalchemy.exc import SQLAlchemyError
+from collections import namedtuple, OrderedDict
+from datetime import timedelta
+from config import Config
+import threading
+import bisect
+import time
+
+CATALOG = 'catalog'
+STOCK = 'stock'
+
+CachedSpecification = namedtuple('CachedSpecification', ['feature', 'value'])
+
+class CachedProduct:
+    """
+    Read-only copy of a product's descriptive fields and specifications.
+    Stock is looked up in the cache's stock snapshot, which is refreshed on
+    its own when only stock levels change.
+    """
+    __slots__ = ('id', 'name', 'price', 'description', 'image', 'category',
+                 'created_at', 'updated_at', 'specifications', '_cache')
+
+    def __init__(self, product, cache):
+        self.id = product.id
+        self.name = product.name
+        self.price = product.price
+        self.description = product.description
+        self.image = product.image
+        self.category = product.category
+        self.created_at = product.created_at
+        self.updated_at = product.updated_at
+        self.specifications = tuple(CachedSpecification(spec.feature, spec.value) for spec in product.specifications)
+        self._cache = cache
+
+    @property
+    def stock(self):
+        return self._cache.stock_levels.get(self.id, 0)
+
+    def __repr__(self):
+        return f'<Product {self.name}>'
+
+class CatalogCache:
+    """
+    Read-through, in-process copy of the product catalog.
+
+    The catalog_version table holds two counters: 'catalog', advanced by
+    product creates, edits and deletes, and 'stock', advanced by stock
+    changes. Readers compare them with the versions they loaded (at most once
+    every CATALOG_VERSION_CHECK_SECONDS, and right after this worker's own
+    writes), reloading all products when 'catalog' moved. When just 'stock'
+    moved only the rows updated since the last load are re-read, going back
+    STOCK_REFRESH_OVERLAP_SECONDS so transactions that committed late are
+    not missed.
+
+    The pair of counters also tags everything derived from the catalog: it
+    is the ETag of the product APIs, and their serialized JSON bodies are
+    memoized per version so a changed ETag costs one serialization per
+    worker, not one per request. While the counters cannot be read
+    (catalog_version not migrated yet) ``versions`` is None: nothing is
+    tagged and no body is memoized, since nothing would tell them apart.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.products = {}
+        self.product_list = []
+        self.by_category = {}
+        # (products, their ids) pairs, each swapped in as one value, for get_page to
+        # bisect the ids; bisect's key= needs Python 3.10+
+        self._all_listing = ([], [])
+        self._category_listings = {}
+        self.stock_levels = {}
+        self._stock_synced_until = None
+        self.versions = {CATALOG: None, STOCK: None}
+        self._last_check = None
+        self._invalidations = 0
+        self._payloads = OrderedDict()
+
+    @staticmethod
+    def bump(*kinds):
+        """Advance the shared counters in the current transaction, so they commit with the change"""
+        try:
+            # A savepoint, so a missing catalog_version table does not fail the write it tags
+            with db.session.begin_nested():
+                for kind in kinds:
+                    updated = CatalogVersion.query.filter_by(name=kind)\
+                        .update({CatalogVersion.version: CatalogVersion.version + 1})
+                    if not updated:
+                        db.session.add(CatalogVersion(name=kind, version=1))
+        except SQLAlchemyError as e:
+            print(f"Error bumping catalog version: {e}")
+
+    @staticmethod
+    def bump_committed(*kinds):
+        """
+        Advance the shared counters in a short transaction of their own, after
+        the change has committed, so busy writers (checkouts) hold the counter
+        row only for that one UPDATE.
+        """
+        try:
+            with db.engine.begin() as connection:
+                for kind in kinds:
+                    updated = connection.execute(CatalogVersion.__table__.update()
+                                                 .where(CatalogVersion.name == kind)
+                                                 .values(version=CatalogVersion.version + 1)).rowcount
+                    if not updated:
+                        connection.execute(CatalogVersion.__table__.insert().values(name=kind, version=1))
+        except SQLAlchemyError as e:
+            print(f"Error bumping catalog version: {e}")
+
+    def invalidate(self):
+        """Check the counters on the next read; call after committing a bumped change"""
+        self._invalidations += 1
+        self._last_check = None
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._last_check is not None and now - self._last_check < Config.CATALOG_VERSION_CHECK_SECONDS:
+            return
+        with self._lock:
+            if self._last_check is not None and now - self._last_check < Config.CATALOG_VERSION_CHECK_SECONDS:
+                return
+            invalidations = self._invalidations
+            # Read the counters before the rows: a write landing in between only causes one extra reload
+            versions = self._read_versions()
+            if versions is None or self.versions is None or versions[CATALOG] != self.versions[CATALOG]:
+                # With no counters to compare (catalog_version not migrated yet) reload on every check
+                self._load_catalog()
+            elif versions[STOCK] != self.versions[STOCK]:
+                self._load_stock_changes()
+            self.versions = versions
+            # A write committed by this worker during the refresh may not be loaded yet
+            if invalidations == self._invalidations:
+                self._last_check = now
+
+    def _load_catalog(self):
+        rows = Product.query.options(selectinload(Product.specifications)).order_by(Product.id).all()
+        products = {product.id: CachedProduct(product, self) for product in rows}
+        by_category = {}
+        for product in products.values():
+            by_category.setdefault(product.category, []).append(product)
+        # Swap in whole structures so concurrent readers see either the old catalog or the new one
+        self.stock_levels = {product.id: product.stock for product in rows}
+        self._stock_synced_until = max((product.updated_at for product in rows if product.updated_at), default=None)
+        self.products = products
+        self.product_list = list(products.values())
+        self.by_category = by_category
+        self._all_listing = (self.product_list, list(products))
+        self._category_listings = {category: (listed, [product.id for product in listed])
+                                   for category, listed in by_category.items()}
+
+    def _load_stock_changes(self):
+        query = db.session.query(Product.id, Product.stock, Product.updated_at)
+        if self._stock_synced_until is not None:
+            since = self._stock_synced_until - timedelta(seconds=Config.STOCK_REFRESH_OVERLAP_SECONDS)
+            query = query.filter(Product.updated_at >= since)
+        stock_levels = dict(self.stock_levels)
+        for product_id, stock, updated_at in query:
+            stock_levels[product_id] = stock
+            if updated_at and (self._stock_synced_until is None or updated_at > self._stock_synced_until):
+                self._stock_synced_until = updated_at
+        self.stock_levels = stock_levels
+
+    def etag(self):
+        """Tag of the catalog and stock versions currently served, or None if they are unknown"""
+        self._refresh()
+        return self._etag(self.versions)
+
+    @classmethod
+    def stored_etag(cls):
+        """Tag of the versions committed in the database, without loading the catalog into memory"""
+        return cls._etag(cls._read_versions())
+
+    @classmethod
+    def stored_version(cls, kind=CATALOG):
+        """One committed counter, or None if the table cannot be read"""
+        versions = cls._read_versions()
+        return versions[kind] if versions is not None else None
+
+    @staticmethod
+    def _read_versions():
+        """The committed counters, a missing row reading as 0; None if the table cannot be read"""
+        try:
+            # On a connection of its own, so a failed read cannot poison the request's session
+            with db.engine.connect() as connection:
+                versions = dict(connection.execute(db.select(CatalogVersion.name, CatalogVersion.version)).all())
+        except SQLAlchemyError as e:
+            print(f"Error reading catalog versions: {e}")
+            return None
+        return {CATALOG: versions.get(CATALOG, 0), STOCK: versions.get(STOCK, 0)}
+
+    @staticmethod
+    def _etag(versions):
+        if versions is None:
+            return None
+        return f"{versions[CATALOG]}.{versions[STOCK]}"
+
+    def payload(self, key, build):
+        """
+        (etag, body) for a response derived from the catalog, calling
+        ``build()`` only if ``key`` has not been serialized at the current versions.
+        The etag is None, and the body built afresh, while the versions are unknown.
+        """
+        self._refresh()
+        versions = self.versions
+        if versions is None:
+            return None, build()
+        with self._lock:
+            cached = self._payloads.get(key)
+            if cached is not None and cached[0] == versions:
+                self._payloads.move_to_end(key)
+                return self._etag(versions), cached[1]
+        body = build()
+        with self._lock:
+            self._payloads[key] = (versions, body)
+            self._payloads.move_to_end(key)
+            while len(self._payloads) > Config.CATALOG_PAYLOAD_CACHE_SIZE:
+                self._payloads.popitem(last=False)
+        return self._etag(versions), body
+
+    def get_all(self):
+        """Every product, in id order"""
+        self._refresh()
+        return list(self.product_list)
+
+    def get(self, product_id):
+        """The product with this id, or None"""
+        self._refresh()
+        return self.products.get(product_id)
+
+    def get_by_category(self, category):
+        """Products in ``category``, in id order"""
+        self._refresh()
+        return list(self.by_category.get(category, []))
+
+    def get_page(self, after_id=None, limit=24, category=None):
+        """Up to ``limit`` products with an id above ``after_id``, and whether more follow"""
+        self._refresh()
+        if category is None:
+            products, ids = self._all_listing
+        else:
+            products, ids = self._category_listings.get(category, ([], []))
+        start = 0
+        if after_id is not None:
+            start = bisect.bisect_right(ids, after_id)
+        page = products[start:start + limit + 1]
+        return page[:limit], len(page) > limit
+
+# Shared by every request handled in this process
+catalog_cache = CatalogCache()
@@ -0,0 +1,92 @@
+from models.database import db, OrderItem
+from config import Config
+import threading
+import time
+
+class CoPurchaseIndex:
+    """
+    Sparse product x product co-occurrence counts built from order history.
+
+    Counts are kept as nested dicts (only pairs that were actually bought
+    together), read once on first use and then extended with just the order
+    items added since the last high-water mark, so neither new orders nor
+    other workers' orders cost a full table scan. Each sync also re-reads the
+    last COPURCHASE_RESCAN_ITEMS items below the mark, since ids are assigned
+    before commit and a slow checkout can commit behind a faster one; orders
+    already counted there are remembered and skipped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+        self.last_item_id = 0
+        # Counted orders with items inside the rescan window, by their highest item id
+        self._counted_orders = {}
+        self._top_cache = {}
+        self._loaded = False
+        self._last_sync = 0.0
+
+    def sync(self, force=False):
+        """Fold order items committed since the last sync into the counts"""
+        now = time.monotonic()
+        if self._loaded and not force and now - self._last_sync < Config.COPURCHASE_SYNC_SECONDS:
+            return
+        with self._lock:
+            rows = db.session.query(OrderItem.id, OrderItem.order_id, OrderItem.product_id)\
+                .filter(OrderItem.id > max(0, self.last_item_id - Config.COPURCHASE_RESCAN_ITEMS))\
+                .order_by(OrderItem.id)\
+                .yield_per(1000)
+
+            baskets = {}
+            newest_items = {}
+            for item_id, order_id, product_id in rows:
+                if order_id in self._counted_orders:
+                    continue
+                baskets.setdefault(order_id, set()).add(product_id)
+                newest_items[order_id] = item_id
+
+            # Only a complete pass is applied, so a failed read is simply retried next sync
+            for order_id, product_ids in baskets.items():
+                self._add_basket(product_ids)
+                self._counted_orders[order_id] = newest_items[order_id]
+            self.last_item_id = max(self.last_item_id, max(newest_items.values(), default=0))
+            window_start = self.last_item_id - Config.COPURCHASE_RESCAN_ITEMS
+            self._counted_orders = {order_id: item_id for order_id, item_id in self._counted_orders.items()
+                                    if item_id > window_start}
+            self._loaded = True
+            self._last_sync = now
+
+    def _add_basket(self, product_ids):
+        """Count every pair of distinct products bought in one order"""
+        for product_id in product_ids:
+            neighbours = self.counts.setdefault(product_id, {})
+            for other_id in product_ids:
+                if other_id != product_id:
+                    neighbours[other_id] = neighbours.get(other_id, 0) + 1
+            self._top_cache.pop(product_id, None)
+
+    def recommend(self, product_id, num_recommendations=5):
+        """Product ids most often bought with ``product_id``, most frequent first"""
+        self.sync()
+        top = self._top_cache.get(product_id)
+        if top is None:
+            with self._lock:
+                neighbours = self.counts.get(product_id, {})
+                top = sorted(neighbours, key=lambda other_id: (-neighbours[other_id], other_id))[:Config.COPURCHASE_TOP_K]
+                self._top_cache[product_id] = top
+        return top[:num_recommendations]
+
+    def recommend_for_basket(self, product_ids, num_recommendations=5):
+        """Product ids most often bought with any of ``product_ids``, excluding those already chosen"""
+        self.sync()
+        basket = set(product_ids)
+        totals = {}
+        with self._lock:
+            for product_id in basket:
+                for other_id, count in self.counts.get(product_id, {}).items():
+                    if other_id not in basket:
+                        totals[other_id] = totals.get(other_id, 0) + count
+        return sorted(totals, key=lambda other_id: (-totals[other_id], other_id))[:num_recommendations]
+
+# Shared by every request handled in this process
+copurchase_index = CoPurchaseIndex()
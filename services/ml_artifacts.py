@@ -0,0 +1,192 @@
+"""
+Versioned on-disk layout for recommendation model artifacts.
+
+Each training run writes a new directory under the artifacts root holding
+flat ``.npy`` arrays (including the vectorizer's) and a ``manifest.json``
+with every file's size and SHA-256, then publishes it by atomically
+replacing the ``CURRENT`` pointer file. Writers that derive a version from
+the current one hold ``publish_lock`` from reading CURRENT until they
+publish, so no two of them build on the same base. Checksums are verified
+once, at publish time; workers loading a version only compare file sizes. Readers
+open the arrays with ``numpy.load(mmap_mode='r')`` so every worker on a host
+shares the same page-cache copy instead of holding a private one.
+"""
+from scipy.sparse import csr_matrix
+from contextlib import contextmanager
+import numpy as np
+import hashlib
+import pickle
+import json
+import shutil
+import time
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: publishes are not serialized across processes
+    fcntl = None
+
+POINTER_FILE = 'CURRENT'
+VECTORIZER_FILE = 'vectorizer.pkl'
+MANIFEST_FILE = 'manifest.json'
+LOCK_FILE = '.publish.lock'
+
+def new_version_dir(root):
+    """Create and return an empty directory for a new artifact version"""
+    os.makedirs(root, exist_ok=True)
+    base = time.strftime('%Y%m%d-%H%M%S')
+    version, suffix = base, 1
+    while os.path.exists(os.path.join(root, version)):
+        suffix += 1
+        version = f'{base}-{suffix}'
+    path = os.path.join(root, version)
+    os.makedirs(path)
+    return path
+
+def save_array(version_dir, name, array):
+    """Write one array as a flat .npy file"""
+    np.save(os.path.join(version_dir, f'{name}.npy'), np.ascontiguousarray(array))
+
+def open_array(version_dir, name, shape, dtype):
+    """Create a writable memory-mapped .npy file to be filled in place"""
+    path = os.path.join(version_dir, f'{name}.npy')
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+
+def save_sparse(version_dir, name, matrix):
+    """Write a CSR matrix as flat data/indices/indptr arrays that can be memory-mapped"""
+    matrix = matrix.tocsr()
+    save_array(version_dir, f'{name}_data', matrix.data)
+    save_array(version_dir, f'{name}_indices', matrix.indices)
+    save_array(version_dir, f'{name}_indptr', matrix.indptr)
+    save_array(version_dir, f'{name}_shape', np.array(matrix.shape, dtype=np.int64))
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def write_manifest(version_dir):
+    """Record the size and SHA-256 of every file in a version"""
+    files = {}
+    for name in sorted(os.listdir(version_dir)):
+        path = os.path.join(version_dir, name)
+        if name != MANIFEST_FILE and os.path.isfile(path):
+            files[name] = {'bytes': os.path.getsize(path), 'sha256': _sha256(path)}
+    manifest = {
+        'version': os.path.basename(os.path.normpath(version_dir)),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'files': files
+    }
+    tmp_path = os.path.join(version_dir, f'.{MANIFEST_FILE}.{os.getpid()}')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(version_dir, MANIFEST_FILE))
+    return manifest
+
+def verify_manifest(version_dir, checksums=True):
+    """
+    Check a version's files against its manifest.
+
+    Returns False for versions published before manifests existed and raises
+    ValueError if any listed file is missing, truncated or (with
+    ``checksums``) altered.
+    """
+    path = os.path.join(version_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return False
+    with open(path) as f:
+        manifest = json.load(f)
+    for name, expected in manifest['files'].items():
+        file_path = os.path.join(version_dir, name)
+        if not os.path.exists(file_path):
+            raise ValueError(f"{name} is missing from version {manifest['version']}")
+        if os.path.getsize(file_path) != expected['bytes']:
+            raise ValueError(f"{name} in version {manifest['version']} does not match its size")
+        if checksums and _sha256(file_path) != expected['sha256']:
+            raise ValueError(f"{name} in version {manifest['version']} does not match its checksum")
+    return True
+
+def publish(root, version_dir, keep=3):
+    """
+    Point CURRENT at ``version_dir`` atomically and prune old versions.
+
+    A version without a manifest gets one written; one that already has a
+    manifest (copied in from elsewhere) must match its checksums first.
+    """
+    version = os.path.basename(os.path.normpath(version_dir))
+    if os.path.exists(os.path.join(version_dir, MANIFEST_FILE)):
+        verify_manifest(version_dir)
+    else:
+        write_manifest(version_dir)
+    tmp_path = os.path.join(root, f'.{POINTER_FILE}.{os.getpid()}')
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, POINTER_FILE))
+    prune_versions(root, keep=keep)
+    return version
+
+@contextmanager
+def publish_lock(root):
+    """Hold the artifacts root's exclusive publish lock, shared by every process on the host"""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK_FILE), 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def prune_versions(root, keep=3):
+    """Delete all but the newest ``keep`` versions, never the current one"""
+    current = current_version(root)
+    versions = sorted(
+        d for d in os.listdir(root)
+        if os.path.isdir(os.path.join(root, d)) and not d.startswith('.')
+    )
+    for version in versions[:-keep] if keep else versions:
+        if version != current:
+            # Workers still mapping these files keep their open inodes
+            shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+
+def current_version(root):
+    """Return the published version name, or None if nothing is published"""
+    try:
+        with open(os.path.join(root, POINTER_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def version_path(root, version):
+    """Directory holding the given version's files"""
+    return os.path.join(root, version)
+
+def load_array(version_dir, name, mmap=True):
+    """Open a saved array, memory-mapped read-only by default"""
+    path = os.path.join(version_dir, f'{name}.npy')
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode='r' if mmap else None)
+
+def load_sparse(version_dir, name, mmap=True):
+    """Rebuild a CSR matrix saved by save_sparse without copying its arrays"""
+    parts = [load_array(version_dir, f'{name}_{part}', mmap=mmap) for part in ('data', 'indices', 'indptr')]
+    shape = load_array(version_dir, f'{name}_shape', mmap=False)
+    if shape is None or any(part is None for part in parts):
+        return None
+    return csr_matrix(tuple(parts), shape=tuple(int(n) for n in shape), copy=False)
+
+def load_vectorizer(version_dir):
+    """Unpickle the scikit-learn vectorizer saved by versions older than the compact format"""
+    path = os.path.join(version_dir, VECTORIZER_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
@@ -1,5 +1,8 @@
 from models.database import db, Order, OrderItem, Product, Cart, CartItem
 from services.cart_service import CartService
+from services.copurchase_service import copurchase_index
+from services.personalization_service import user_profiles
+from services.catalog_cache import catalog_cache, STOCK
 
 class OrderService:
     @staticmethod
@@ -51,12 +54,32 @@ class OrderService:
                 CartItem.query.filter_by(cart_id=cart.id).delete()
 
             db.session.commit()
+            OrderService._publish_stock_change()
+            OrderService._update_recommenders(user_id)
             return True, "Order created successfully."
 
         except Exception as e:
             db.session.rollback()
             return False, f"An error occurred while creating the order: {str(e)}"
 
+    @staticmethod
+    def _publish_stock_change():
+        """Tell every worker's catalog cache that stock moved; the order is already committed"""
+        try:
+            catalog_cache.bump_committed(STOCK)
+            catalog_cache.invalidate()
+        except Exception as e:
+            print(f"Error publishing stock change after order: {e}")
+
+    @staticmethod
+    def _update_recommenders(user_id):
+        """Fold the just-committed order into co-purchase counts and the buyer's profile"""
+        try:
+            copurchase_index.sync(force=True)
+            user_profiles.get_profile(user_id, force_sync=True)
+        except Exception as e:
+            print(f"Error updating recommenders after order: {e}")
+
     @staticmethod
     def get_orders_by_user(user_id):
         """Fetch all orders for a specific user."""
@@ -0,0 +1,116 @@
+from models.database import db, Order, OrderItem, Product
+from services.recommendation_service import recommendation_engine
+from collections import OrderedDict
+from config import Config
+import scipy.sparse as sp
+import numpy as np
+import threading
+import heapq
+import time
+
+class UserProfile:
+    """
+    A user's taste vector: quantity-weighted sum of the TF-IDF vectors of what
+    they ordered, kept sparse as its PROFILE_MAX_TERMS heaviest terms.
+    """
+
+    def __init__(self, version, n_features):
+        self.version = version
+        self.n_features = n_features
+        self.weights = {}
+        self.purchased = set()
+        self.last_item_id = 0
+        self.synced_at = 0.0
+
+    def vector(self):
+        """The profile as a dense array over the vocabulary, built per query rather than cached"""
+        vector = np.zeros(self.n_features, dtype=np.float32)
+        vector[np.fromiter(self.weights.keys(), dtype=np.int64, count=len(self.weights))] = \
+            np.fromiter(self.weights.values(), dtype=np.float32, count=len(self.weights))
+        return vector
+
+class UserProfileCache:
+    """
+    Per-user profile vectors, cached in memory and extended incrementally.
+
+    A profile is built from the full order history once per model version;
+    afterwards only order items newer than its high-water mark are added.
+    """
+
+    def __init__(self, engine=None):
+        self.engine = engine or recommendation_engine
+        self._lock = threading.Lock()
+        self.profiles = OrderedDict()
+
+    @staticmethod
+    def _order_history(user_id, after_item_id=0):
+        """(order item id, product name, quantity) for the user's items after ``after_item_id``"""
+        return db.session.query(OrderItem.id, Product.name, OrderItem.quantity)\
+            .join(Order, Order.id == OrderItem.order_id)\
+            .join(Product, Product.id == OrderItem.product_id)\
+            .filter(Order.user_id == user_id, OrderItem.id > after_item_id)\
+            .order_by(OrderItem.id)\
+            .all()
+
+    @staticmethod
+    def _add_items(profile, state, items):
+        for item_id, name, quantity in items:
+            # A concurrent sync of the same user may already have added it
+            if item_id <= profile.last_item_id:
+                continue
+            profile.last_item_id = item_id
+            profile.purchased.add(name)
+            rows = state.rows_by_name.get(name)
+            if rows is None:
+                continue
+            # Unit-length centroid of the name's rows, summed sparse rather than over the whole vocabulary
+            terms = (sp.csr_matrix(np.ones((1, len(rows)), dtype=np.float32)) @ state.tfidf_matrix[rows]).tocsr()
+            norm = np.sqrt(terms.multiply(terms).sum())
+            if not norm:
+                continue
+            for column, value in zip(terms.indices, terms.data):
+                profile.weights[column] = profile.weights.get(column, 0.0) + quantity * float(value) / norm
+        if len(profile.weights) > Config.PROFILE_MAX_TERMS:
+            profile.weights = dict(heapq.nlargest(Config.PROFILE_MAX_TERMS, profile.weights.items(),
+                                                  key=lambda term: term[1]))
+
+    def get_profile(self, user_id, force_sync=False):
+        """The user's up-to-date profile, or None when there is no model to build it from"""
+        self.engine.ensure_loaded()
+        state = self.engine.state
+        if not state.ready or state.tfidf_matrix is None:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            profile = self.profiles.get(user_id)
+            if profile is None or profile.version != state.version:
+                profile = UserProfile(state.version, state.tfidf_matrix.shape[1])
+                force_sync = True
+            self.profiles[user_id] = profile
+            self.profiles.move_to_end(user_id)
+            while len(self.profiles) > Config.PROFILE_CACHE_SIZE:
+                self.profiles.popitem(last=False)
+            sync = force_sync or now - profile.synced_at >= Config.PROFILE_SYNC_SECONDS
+            after_item_id = profile.last_item_id
+
+        if sync:
+            # Query outside the lock so one user's history read does not stall every other user
+            items = self._order_history(user_id, after_item_id)
+            with self._lock:
+                self._add_items(profile, state, items)
+                profile.synced_at = now
+        return profile
+
+    def recommend(self, user_id, num_recommendations=5):
+        """ML products closest to the user's profile, skipping names they already bought"""
+        profile = self.get_profile(user_id)
+        if profile is None or not profile.weights:
+            return []
+        with self._lock:
+            vector = profile.vector()
+            purchased = set(profile.purchased)
+        return self.engine.recommend_for_vector(vector, num_recommendations, exclude_names=purchased)
+
+# Shared by every request handled in this process
+user_profiles = UserProfileCache()
@@ -1,9 +1,12 @@
-from models.database import db, Product, ProductSpecification, MLProduct
-from sqlalchemy import or_
-import pandas as pd
-import pickle
-import os
+from models.database import db, Product, ProductSpecification, ProductRecommendation, MLProduct
+from services.recommendation_service import recommendation_engine
+from services.copurchase_service import copurchase_index
+from services.personalization_service import user_profiles
+from services.search_index import product_search
+from services.catalog_cache import catalog_cache, CATALOG, STOCK
+from sqlalchemy.orm import joinedload
 from config import Config
+import pandas as pd
 
 class ProductService:
     """Service class for product operations"""
@@ -12,44 +15,124 @@ class ProductService:
     def get_all_products():
         """Get all products with their specifications"""
         try:
-            products = Product.query.all()
-            return products
+            return catalog_cache.get_all()
         except Exception as e:
             print(f"Error fetching products: {e}")
             return []
     
+    @staticmethod
+    def get_products_page(after_id=None, limit=None, category=None):
+        """
+        One page of products in id order, optionally from one category.
+        Returns the products and the cursor for the next page (None on the last page).
+        """
+        try:
+            limit = max(1, min(limit or Config.PRODUCT_PAGE_SIZE, Config.PRODUCT_PAGE_SIZE_MAX))
+            # Keyset pagination: seek past the last id seen instead of counting an OFFSET
+            products, has_more = catalog_cache.get_page(after_id, limit, category)
+            return products, (products[-1].id if has_more else None)
+        except Exception as e:
+            print(f"Error fetching products page: {e}")
+            return [], None
+    
+    @staticmethod
+    def iter_product_chunks(chunk_size=None, category=None):
+        """
+        Yield every product (optionally from one category) in id order, as
+        lists of at most ``chunk_size``, fetched from the database as they are
+        consumed rather than loaded all at once.
+
+        Errors propagate: a caller that has already sent part of the export
+        must be able to tell it is incomplete.
+        """
+        chunk_size = chunk_size or Config.PRODUCT_EXPORT_CHUNK_SIZE
+        query = Product.query
+        if category is not None:
+            query = query.filter(Product.category == category)
+        chunk = []
+        for product in query.order_by(Product.id).yield_per(chunk_size):
+            chunk.append(product)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    
     @staticmethod
     def get_product_by_id(product_id):
         """Get product by ID with specifications"""
         try:
-            product = Product.query.get(product_id)
+            return catalog_cache.get(product_id)
+        except Exception as e:
+            print(f"Error fetching product {product_id}: {e}")
+            return None
+    
+    @staticmethod
+    def get_catalog_etag(cached=True):
+        """ETag of the catalog as currently served (or, with ``cached=False``, as stored), for conditional requests; None if unversioned"""
+        return catalog_cache.etag() if cached else catalog_cache.stored_etag()
+    
+    @staticmethod
+    def get_catalog_payload(key, build):
+        """(etag, body) of a response built from the catalog, serialized once per catalog version"""
+        return catalog_cache.payload(key, build)
+    
+    @staticmethod
+    def get_product_with_recommendations(product_id):
+        """Get a product with its specifications and precomputed recommendations in one query"""
+        try:
+            product = Product.query.options(
+                joinedload(Product.specifications),
+                joinedload(Product.recommendations).joinedload(ProductRecommendation.rec_product)
+            ).filter(Product.id == product_id).first()
             return product
         except Exception as e:
             print(f"Error fetching product {product_id}: {e}")
             return None
     
     @staticmethod
-    def search_products(query):
-        """Search products by name or description"""
+    def search_products(query, limit=None):
+        """Search products by name, category and description, most relevant first"""
         try:
-            products = Product.query.filter(
-                or_(
-                    Product.name.ilike(f'%{query}%'),
-                    Product.description.ilike(f'%{query}%'),
-                    Product.category.ilike(f'%{query}%')
-                )
-            ).all()
+            limit = limit or Config.SEARCH_RESULT_LIMIT
+            # Names and categories that look like the query (typos included) come before word matches
+            ranked = product_search.fuzzy_search(query, limit) + product_search.search(query, limit)
+            product_ids = list(dict.fromkeys(product_id for product_id, _ in ranked))[:limit]
+            products = ProductService._products_in_order(product_ids)
+            # Products deleted through another worker are dropped from this worker's index
+            for product_id in set(product_ids) - {p.id for p in products}:
+                product_search.remove(product_id)
             return products
         except Exception as e:
             print(f"Error searching products: {e}")
             return []
     
+    @staticmethod
+    def suggest_products(prefix, limit=10):
+        """Autocomplete a search box from product names and categories, without querying the database"""
+        try:
+            return [{'text': text, 'type': kind} for text, kind in product_search.suggest(prefix, limit)]
+        except Exception as e:
+            print(f"Error suggesting products: {e}")
+            return []
+    
+    @staticmethod
+    def semantic_search(query, limit=10):
+        """Rank products by TF-IDF similarity of their description and ingredients to ``query``"""
+        try:
+            matches = recommendation_engine.search(query, limit)
+            products = ProductService.get_products_by_names([match['product_name'] for match in matches])
+            scores = {match['product_name']: match['similarity_score'] for match in matches}
+            return [(product, scores[product.name]) for product in products]
+        except Exception as e:
+            print(f"Error running semantic search: {e}")
+            return []
+    
     @staticmethod
     def get_products_by_category(category):
         """Get products by category"""
         try:
-            products = Product.query.filter_by(category=category).all()
-            return products
+            return catalog_cache.get_by_category(category)
         except Exception as e:
             print(f"Error fetching products by category: {e}")
             return []
@@ -114,7 +197,11 @@ class ProductService:
                     )
                     db.session.add(product_spec)
             
+            catalog_cache.bump(CATALOG)
             db.session.commit()
+            catalog_cache.invalidate()
+            product_search.add(product)
+            ProductService.refresh_recommendations(product)
             return True, "Product created successfully"
             
         except Exception as e:
@@ -129,12 +216,23 @@ class ProductService:
             if not product:
                 return False, "Product not found"
             
-            # Update product fields
+            # Update product fields, noting which actually change: forms resubmit every field
+            changed = set()
             for key, value in kwargs.items():
                 if hasattr(product, key) and key != 'id':
+                    if getattr(product, key) != value:
+                        changed.add(key)
                     setattr(product, key, value)
             
+            if 'price' in changed and not changed & {'name', 'description', 'category'}:
+                # Price is not a text feature: keep the linked ML row in step without re-indexing
+                MLProduct.query.filter_by(store_product_id=product.id).update({MLProduct.price: product.price})
+            catalog_cache.bump(CATALOG)
             db.session.commit()
+            catalog_cache.invalidate()
+            if changed & {'name', 'description', 'category'}:
+                product_search.add(product)
+                ProductService.refresh_recommendations(product)
             return True, "Product updated successfully"
             
         except Exception as e:
@@ -149,8 +247,13 @@ class ProductService:
             if not product:
                 return False, "Product not found"
             
+            # Drop it from other products' precomputed recommendations too
+            ProductRecommendation.query.filter_by(rec_product_id=product_id).delete()
             db.session.delete(product)
+            catalog_cache.bump(CATALOG)
             db.session.commit()
+            catalog_cache.invalidate()
+            product_search.remove(product_id)
             return True, "Product deleted successfully"
             
         except Exception as e:
@@ -167,12 +270,42 @@ class ProductService:
             
             product.stock = max(0, product.stock + quantity)
             db.session.commit()
+            catalog_cache.bump_committed(STOCK)
+            catalog_cache.invalidate()
             return True, "Stock updated successfully"
             
         except Exception as e:
             db.session.rollback()
             return False, f"Error updating stock: {str(e)}"
     
+    @staticmethod
+    def set_stock(stock_levels):
+        """Set products' stock to absolute values ({product id: stock}), leaving unchanged ones untouched"""
+        try:
+            if not stock_levels:
+                return True, "Stock unchanged"
+            
+            # Lock the rows so a checkout cannot interleave between the read and the write
+            products = Product.query.filter(Product.id.in_(list(stock_levels))).with_for_update().all()
+            changed = 0
+            for product in products:
+                stock = max(0, stock_levels[product.id])
+                if product.stock != stock:
+                    product.stock = stock
+                    changed += 1
+            
+            if not changed:
+                db.session.rollback()
+                return True, "Stock unchanged"
+            db.session.commit()
+            catalog_cache.bump_committed(STOCK)
+            catalog_cache.invalidate()
+            return True, f"Stock updated for {changed} products"
+            
+        except Exception as e:
+            db.session.rollback()
+            return False, f"Error updating stock: {str(e)}"
+    
     @staticmethod
     def get_low_stock_products(threshold=5):
         """Get products with low stock"""
@@ -184,54 +317,153 @@ class ProductService:
             return []
     
     @staticmethod
-    def get_ml_recommendations(product_name, num_recommendations=5):
-        """Get ML-based product recommendations"""
+    def get_ml_recommendations(product_name, num_recommendations=5, same_category=False):
+        """Get ML-based product recommendations, optionally from the product's own ML category only"""
         try:
-            # Load ML models
-            if not os.path.exists(Config.TFIDF_VECTORIZER_PATH) or not os.path.exists(Config.COSINE_SIM_PATH):
+            return recommendation_engine.get_recommendations(product_name, num_recommendations,
+                                                             same_category=same_category)
+        except Exception as e:
+            print(f"Error getting ML recommendations: {e}")
+            return []
+    
+    @staticmethod
+    def get_ml_recommendations_batch(product_names, num_recommendations=5):
+        """Get ML-based recommendations for several products at once, keyed by name"""
+        try:
+            return recommendation_engine.get_recommendations_batch(product_names, num_recommendations)
+        except Exception as e:
+            print(f"Error getting batch ML recommendations: {e}")
+            return {name: [] for name in product_names}
+    
+    @staticmethod
+    def get_personalized_recommendations(user_id, num_recommendations=4):
+        """Get products matching a user's order history that they haven't bought yet"""
+        try:
+            ml_recs = user_profiles.recommend(user_id, num_recommendations)
+            return ProductService.get_products_by_names([rec['product_name'] for rec in ml_recs])
+        except Exception as e:
+            print(f"Error getting personalized recommendations for user {user_id}: {e}")
+            return []
+    
+    @staticmethod
+    def get_frequently_bought_together(product_id, num_recommendations=4):
+        """Get products most often ordered together with the given product"""
+        try:
+            return ProductService._products_in_order(copurchase_index.recommend(product_id, num_recommendations))
+        except Exception as e:
+            print(f"Error getting frequently bought together for {product_id}: {e}")
+            return []
+    
+    @staticmethod
+    def get_frequently_bought_with(product_ids, num_recommendations=4):
+        """Get products most often ordered together with any of the given products"""
+        try:
+            if not product_ids:
                 return []
+            return ProductService._products_in_order(
+                copurchase_index.recommend_for_basket(product_ids, num_recommendations))
+        except Exception as e:
+            print(f"Error getting frequently bought together for cart: {e}")
+            return []
+    
+    @staticmethod
+    def _products_in_order(product_ids):
+        """Fetch products by ID, keeping the given order"""
+        product_map = {p.id: p for p in ProductService.get_products_by_ids(product_ids)}
+        return [product_map[pid] for pid in product_ids if pid in product_map]
+    
+    @staticmethod
+    def refresh_recommendations(product):
+        """Sync a created or edited product into its own ML catalog row and patch its recommendations"""
+        try:
+            # Only the row linked to this product is ever rewritten; catalog rows that merely share its name are not
+            ml_product = MLProduct.query.filter_by(store_product_id=product.id).first()
+            if not ml_product:
+                next_id = (db.session.query(db.func.max(MLProduct.product_id)).scalar() or 0) + 1
+                ml_product = MLProduct(product_id=next_id, store_product_id=product.id, category='', ingredients='')
             
-            with open(Config.TFIDF_VECTORIZER_PATH, 'rb') as f:
-                tfidf_vectorizer = pickle.load(f)
-            
-            with open(Config.COSINE_SIM_PATH, 'rb') as f:
-                cosine_sim = pickle.load(f)
-            
-            # Get ML products from database
-            ml_products = MLProduct.query.all()
-            if not ml_products:
-                return []
+            ml_product.product_name = product.name
+            if product.category and product.category != 'None':
+                ml_product.category = product.category
+            elif not ml_product.category:
+                # No store category: borrow the one the ML catalog already uses for this name
+                ml_product.category = db.session.query(MLProduct.category)\
+                    .filter(MLProduct.product_name == product.name, MLProduct.category != '')\
+                    .order_by(MLProduct.id).limit(1).scalar() or ''
+            ml_product.description = product.description
+            ml_product.price = product.price
+            ml_product.combined_features = f"{product.description} {ml_product.ingredients}".strip()
+            db.session.add(ml_product)
+            db.session.commit()
             
-            # Find the product index
-            product_names = [p.product_name for p in ml_products]
-            try:
-                product_idx = product_names.index(product_name)
-            except ValueError:
-                return []
+            changed_names = recommendation_engine.apply_product_update({
+                'product_id': ml_product.product_id,
+                'product_name': ml_product.product_name,
+                'category': ml_product.category,
+                'description': ml_product.description,
+                'price': ml_product.price
+            }, ml_product.combined_features)
+            if changed_names:
+                ProductService.rebuild_recommendation_table(product_names=changed_names)
+            return True
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error refreshing recommendations for {product.name}: {e}")
+            return False
+    
+    @staticmethod
+    def rebuild_recommendation_table(num_recommendations=None, product_names=None):
+        """
+        Rewrite the product_recommendation table from the loaded recommendation model,
+        or with ``product_names`` only the rows of the store products carrying or
+        recommending those names
+        """
+        try:
+            num_recommendations = num_recommendations or Config.RECOMMENDATIONS_PER_PRODUCT
+            products = db.session.query(Product.id, Product.name).order_by(Product.id).all()
+            by_name = {}
+            for product in products:
+                by_name.setdefault(product.name, product)
+            if product_names is not None:
+                # Also products currently recommending one of them, whose entry may no longer resolve by name
+                named_ids = [product.id for product in products if product.name in product_names]
+                referring = {product_id for (product_id,) in db.session.query(ProductRecommendation.product_id)
+                             .filter(ProductRecommendation.rec_product_id.in_(named_ids)).distinct()}
+                products = [product for product in products
+                            if product.name in product_names or product.id in referring]
             
-            # Get similarity scores
-            sim_scores = list(enumerate(cosine_sim[product_idx]))
-            sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-            sim_scores = sim_scores[1:num_recommendations+1]
+            # One extra in case a product is recommended to itself
+            ml_recs = recommendation_engine.get_recommendations_batch(
+                list(dict.fromkeys(product.name for product in products)), num_recommendations + 1)
             
-            # Get recommended products
-            recommended_products = []
-            for idx, score in sim_scores:
-                if idx < len(ml_products):
-                    recommended_products.append({
-                        'product_id': ml_products[idx].product_id,
-                        'product_name': ml_products[idx].product_name,
-                        'category': ml_products[idx].category,
-                        'description': ml_products[idx].description,
-                        'price': ml_products[idx].price,
-                        'similarity_score': score
+            rows = []
+            for product in products:
+                rank = 0
+                for rec in ml_recs.get(product.name, []):
+                    rec_product = by_name.get(rec['product_name'])
+                    if not rec_product or rec_product.id == product.id:
+                        continue
+                    rank += 1
+                    rows.append({
+                        'product_id': product.id,
+                        'rec_product_id': rec_product.id,
+                        'rank': rank,
+                        'score': rec['similarity_score']
                     })
+                    if rank >= num_recommendations:
+                        break
             
-            return recommended_products
+            stale = ProductRecommendation.query
+            if product_names is not None:
+                stale = stale.filter(ProductRecommendation.product_id.in_([product.id for product in products]))
+            stale.delete(synchronize_session=False)
+            db.session.bulk_insert_mappings(ProductRecommendation, rows)
+            db.session.commit()
+            return True, f"Saved {len(rows)} recommendations for {len(products)} products"
             
         except Exception as e:
-            print(f"Error getting ML recommendations: {e}")
-            return []
+            db.session.rollback()
+            return False, f"Error rebuilding product recommendations: {str(e)}"
     
     @staticmethod
     def migrate_products_from_csv(csv_file):
@@ -269,7 +501,9 @@ class ProductService:
                         )
                         db.session.add(product_spec)
             
+            catalog_cache.bump(CATALOG)
             db.session.commit()
+            catalog_cache.invalidate()
             return True, "Products migrated successfully"
             
         except Exception as e:
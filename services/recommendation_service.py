@@ -0,0 +1,638 @@
+from models.database import MLProduct
+from services.similarity import top_k_neighbors
+from services.ann_index import LSHIndex
+from services.text_vectorizer import CompactTfidfVectorizer, load_vectorizer
+from services import ml_artifacts
+from config import Config
+from flask import current_app, has_app_context
+import scipy.sparse as sp
+import numpy as np
+import subprocess
+import threading
+import pickle
+import signal
+import mmap
+import time
+import sys
+import os
+
+def _is_mapped(array):
+    """Whether an array's memory ultimately comes from a memory-mapped file"""
+    while array is not None:
+        if isinstance(array, (np.memmap, mmap.mmap)):
+            return True
+        array = getattr(array, 'base', None)
+    return False
+
+# Upper bound on memoized lookups kept per loaded model version
+RESULTS_CACHE_SIZE = 10000
+
+# Rows ranked by name after scoring the whole catalog against a vector
+VECTOR_SHORTLIST = 200
+
+class ModelState:
+    """One loaded model version; replaced as a whole so readers never see a mix"""
+
+    def __init__(self, version=None, vectorizer=None, neighbor_indices=None, neighbor_scores=None, catalog=None,
+                 tfidf_matrix=None, ann_index=None, product_ids=None, drift_counts=None):
+        self.version = version
+        self.vectorizer = vectorizer
+        self.neighbor_indices = neighbor_indices
+        self.neighbor_scores = neighbor_scores
+        self.catalog = catalog or []
+        self.tfidf_matrix = tfidf_matrix
+        self.ann_index = ann_index
+        self.product_ids = product_ids
+        # Out-of-vocabulary and total tokens seen by incremental updates since the last full fit
+        self.drift_counts = drift_counts if drift_counts is not None else np.zeros(2, dtype=np.int64)
+        self.results_cache = {}
+        self._category_indexes = {}
+        self._build_indexes()
+
+    def _build_indexes(self):
+        """Build name and product_id lookups over the table rows"""
+        # The synthetic catalog reuses a handful of names across thousands of rows,
+        # so a name maps to every row carrying it rather than to the first match.
+        rows_by_name = {}
+        rows_by_category = {}
+        self.row_by_id = {}
+        self.name_codes = np.full(len(self.catalog), -1, dtype=np.int32)
+        for row, product in enumerate(self.catalog):
+            if not product:
+                continue
+            rows_by_name.setdefault(product['product_name'], []).append(row)
+            rows_by_category.setdefault(product['category'], []).append(row)
+            self.row_by_id.setdefault(product['product_id'], row)
+        self.rows_by_name = {name: np.array(rows, dtype=np.int64) for name, rows in rows_by_name.items()}
+        self.rows_by_category = {category: np.array(rows, dtype=np.int64) for category, rows in rows_by_category.items()}
+        self.code_by_name = {name: code for code, name in enumerate(self.rows_by_name)}
+        for name, rows in self.rows_by_name.items():
+            self.name_codes[rows] = self.code_by_name[name]
+
+    def query_vector(self, rows):
+        """Unit-length centroid of the TF-IDF vectors of ``rows``"""
+        if len(rows) == 1:
+            return self.tfidf_matrix[rows[0]]
+        centroid = np.asarray(self.tfidf_matrix[rows].sum(axis=0), dtype=np.float32)
+        norm = np.linalg.norm(centroid)
+        return centroid / norm if norm else centroid
+
+    def category_index(self, category):
+        """A category's rows and their own compact TF-IDF sub-matrix, built on first use"""
+        index = self._category_indexes.get(category)
+        if index is None:
+            rows = self.rows_by_category.get(category)
+            if rows is None or self.tfidf_matrix is None:
+                return None
+            index = (rows, self.tfidf_matrix[rows])
+            self._category_indexes[category] = index
+        return index
+
+    @property
+    def ready(self):
+        return self.neighbor_indices is not None and bool(self.catalog)
+
+class RecommendationEngine:
+    """Process-wide recommendation model, loaded once and served from memory"""
+
+    def __init__(self, artifacts_dir=None, vectorizer_path=None, similarity_path=None, catalog_loader=None):
+        self.artifacts_dir = artifacts_dir or Config.ML_ARTIFACTS_DIR
+        self.vectorizer_path = vectorizer_path or Config.TFIDF_VECTORIZER_PATH
+        self.similarity_path = similarity_path or Config.COSINE_SIM_PATH
+        self.catalog_loader = catalog_loader or RecommendationEngine.load_ml_catalog
+        self.check_interval = Config.ML_ARTIFACTS_CHECK_SECONDS
+        self.index_mode = Config.RECOMMENDATION_INDEX
+        self._refit_process = None
+        self._app = None
+        self._reload_thread = None
+        self._rejected_version = None
+        self._lock = threading.RLock()
+        # Separate from _lock so a reload signal never waits on a long load
+        self._reload_lock = threading.RLock()
+        self._loaded = False
+        self._last_check = 0.0
+        self.state = ModelState()
+        self.load_seconds = None
+        self.loaded_at = None
+
+    @staticmethod
+    def load_ml_catalog():
+        """Read the ML catalog from the database as plain dicts"""
+        return [
+            {
+                'product_id': p.product_id,
+                'product_name': p.product_name,
+                'category': p.category,
+                'description': p.description,
+                'price': p.price
+            } for p in MLProduct.query.all()
+        ]
+
+    def _load_version(self, version):
+        """Map a published artifact version into a new ModelState"""
+        version_dir = ml_artifacts.version_path(self.artifacts_dir, version)
+        if Config.ML_ARTIFACTS_VERIFY:
+            # Checksums were verified at publish; hashing every file again on each load costs seconds
+            ml_artifacts.verify_manifest(version_dir, checksums=False)
+        indices = ml_artifacts.load_array(version_dir, 'neighbor_indices')
+        scores = ml_artifacts.load_array(version_dir, 'neighbor_scores')
+        product_ids = ml_artifacts.load_array(version_dir, 'product_ids')
+        vectorizer = load_vectorizer(version_dir)
+        tfidf_matrix = ml_artifacts.load_sparse(version_dir, 'tfidf')
+        ann_index = LSHIndex.load(version_dir)
+        drift_counts = ml_artifacts.load_array(version_dir, 'drift_counts', mmap=False)
+        if indices is None or scores is None or product_ids is None:
+            raise FileNotFoundError(f"Incomplete artifact version {version}")
+
+        # Align catalog rows with the table rows; products missing from the DB stay None
+        by_id = {p['product_id']: p for p in self.catalog_loader()}
+        catalog = [by_id.get(int(pid)) for pid in product_ids]
+        return ModelState(version, vectorizer, indices, scores, catalog, tfidf_matrix, ann_index,
+                          product_ids, drift_counts)
+
+    def _load_legacy(self):
+        """Derive a ModelState from the old dense cosine_sim.pkl, if present"""
+        if not os.path.exists(self.similarity_path) or not os.path.exists(self.vectorizer_path):
+            return ModelState()
+
+        print(f"No published artifacts in {self.artifacts_dir}; deriving neighbors from {self.similarity_path}")
+        with open(self.vectorizer_path, 'rb') as f:
+            vectorizer = CompactTfidfVectorizer.from_sklearn(pickle.load(f))
+        with open(self.similarity_path, 'rb') as f:
+            cosine_sim = pickle.load(f)
+        indices, scores = top_k_neighbors(cosine_sim, Config.RECOMMENDATION_TOP_K)
+        # The legacy matrix rows follow the ML catalog order
+        catalog = self.catalog_loader()
+        product_ids = np.array([p['product_id'] for p in catalog], dtype=np.int64)
+        return ModelState(None, vectorizer, indices, scores, catalog, product_ids=product_ids)
+
+    def load(self, version=None):
+        """Load ``version`` (the current one by default) and the ML catalog"""
+        with self._lock:
+            started = time.perf_counter()
+
+            version = version or ml_artifacts.current_version(self.artifacts_dir)
+            state = self._load_version(version) if version else self._load_legacy()
+            if not state.ready:
+                print("Recommendation model files not found; recommendations disabled")
+
+            self.state = state
+            self.load_seconds = time.perf_counter() - started
+            self.loaded_at = time.time()
+            self._last_check = time.monotonic()
+            self._loaded = True
+
+        stats = self.stats()
+        print(f"Recommendation engine loaded {stats['catalog_size']} products (version {stats['version']}) "
+              f"in {stats['load_seconds']:.2f}s ({stats['resident_bytes'] / 1e6:.1f} MB)")
+        return True
+
+    def ensure_loaded(self):
+        """Load the model on first use and pick up newly published versions"""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.load()
+            return
+
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        if ml_artifacts.current_version(self.artifacts_dir) not in (self.state.version, self._rejected_version):
+            # Keep serving the loaded model while the new one loads
+            self.reload_async()
+
+    def init_app(self, app):
+        """Use ``app`` for background reloads and reload on the configured signal"""
+        self._app = app
+        signal_name = app.config.get('RECOMMENDATION_RELOAD_SIGNAL')
+        if signal_name and hasattr(signal, signal_name):
+            try:
+                signal.signal(getattr(signal, signal_name), lambda signum, frame: self.reload_async())
+            except ValueError:
+                # Handlers can only be installed from the main thread
+                pass
+
+    def reload_async(self):
+        """
+        Load the published version on a background thread and swap it in.
+
+        Requests keep using the current model until the new one is fully
+        loaded and verified; the swap is a single reference assignment and the
+        old state is freed as soon as in-flight requests drop it. Returns
+        False if a reload is already running.
+        """
+        with self._reload_lock:
+            if self._reload_thread is not None and self._reload_thread.is_alive():
+                return False
+            app = self._app or (current_app._get_current_object() if has_app_context() else None)
+            self._reload_thread = threading.Thread(target=self._background_reload, args=(app,),
+                                                   name='recommendation-reload', daemon=True)
+            self._reload_thread.start()
+            return True
+
+    def _background_reload(self, app):
+        # Pin the version up front: CURRENT may move again while this one loads
+        version = ml_artifacts.current_version(self.artifacts_dir)
+        try:
+            with self._lock:
+                # An update applied while this thread waited may have published (and loaded) a newer
+                # version; installing the pinned one would roll it back
+                if version != ml_artifacts.current_version(self.artifacts_dir) or version == self.state.version:
+                    return
+                if app is not None:
+                    with app.app_context():
+                        self.load(version)
+                else:
+                    self.load(version)
+            self._rejected_version = None
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError) as e:
+            # Missing, truncated or altered files: don't retry this version on every check
+            self._rejected_version = version
+            print(f"Error loading recommendation model version {version}, "
+                  f"still serving version {self.state.version}: {e}")
+        except Exception as e:
+            # Transient failures (e.g. reading the ML catalog) are retried on the next check
+            print(f"Error reloading recommendation model, still serving version {self.state.version}: {e}")
+
+    def _neighbors(self, state, rows):
+        """Candidate neighbor rows and scores for ``rows``, from the ANN index or the table"""
+        if self.index_mode == 'ann' and state.ann_index is not None and state.tfidf_matrix is not None:
+            return state.ann_index.query(state.query_vector(rows), state.tfidf_matrix,
+                                         Config.RECOMMENDATION_TOP_K, exclude=rows)
+        return np.asarray(state.neighbor_indices[rows]).ravel(), np.asarray(state.neighbor_scores[rows]).ravel()
+
+    def _rank(self, state, rows, num_recommendations, exclude_code=-1):
+        """Best-scoring distinct product names among the neighbors of ``rows``"""
+        candidates, scores = self._neighbors(state, rows)
+        return self._top_distinct(state, candidates, scores, num_recommendations, exclude_code)
+
+    def _rank_in_category(self, state, rows, category, num_recommendations, exclude_code=-1):
+        """Best-scoring distinct names among one category's rows, scoring only that category"""
+        index = state.category_index(category)
+        if index is None:
+            # Without stored vectors, keep the table neighbors that fall in the category
+            candidates, scores = self._neighbors(state, rows)
+            in_category = np.isin(candidates, state.rows_by_category.get(category, []))
+            return self._top_distinct(state, candidates[in_category], scores[in_category], num_recommendations,
+                                      exclude_code)
+        category_rows, matrix = index
+        vector = state.query_vector(rows)
+        scores = matrix @ (vector.T if sp.issparse(vector) else vector.ravel())
+        scores = np.asarray(scores.toarray() if sp.issparse(scores) else scores).ravel()
+        return self._rank_scores(state, scores, num_recommendations, exclude_code, rows=category_rows)
+
+    @staticmethod
+    def _top_distinct(state, candidates, scores, num_recommendations, exclude_code=-1):
+        """Keep each candidate name once at its best score and return the top ones as dicts"""
+        codes = state.name_codes[candidates]
+        keep = (codes >= 0) & ~np.isin(codes, exclude_code) & (scores > 0)
+        candidates, scores, codes = candidates[keep], scores[keep], codes[keep]
+        if not len(candidates) or num_recommendations <= 0:
+            return []
+
+        # Group by name with the best score first, then keep each name's best row
+        order = np.lexsort((-scores, codes))
+        grouped = codes[order]
+        firsts = order[np.concatenate(([True], grouped[1:] != grouped[:-1]))]
+
+        if len(firsts) > num_recommendations:
+            firsts = firsts[np.argpartition(-scores[firsts], num_recommendations - 1)[:num_recommendations]]
+        firsts = firsts[np.argsort(-scores[firsts], kind='stable')]
+        return [
+            dict(state.catalog[candidates[i]], similarity_score=float(scores[i]))
+            for i in firsts
+        ]
+
+    def get_recommendations(self, product_name, num_recommendations=5, category=None, same_category=False):
+        """
+        Get products similar to the named ML product.
+
+        With ``category`` set, only that category's products are scored and
+        recommended; ``same_category`` uses the category of the named product's
+        own ML row. Otherwise recommendations come from the whole catalog.
+        """
+        self.ensure_loaded()
+        state = self.state
+        if not state.ready:
+            return []
+
+        rows = state.rows_by_name.get(product_name)
+        if same_category and category is None:
+            # Same first-row convention as row_by_id; no ML category means nothing to match
+            category = state.catalog[rows[0]]['category'] if rows is not None else None
+            if not category:
+                return []
+
+        key = (product_name, num_recommendations, category)
+        cached = state.results_cache.get(key)
+        if cached is None:
+            if rows is None:
+                return []
+            exclude_code = state.code_by_name[product_name]
+            if category is None:
+                cached = self._rank(state, rows, num_recommendations, exclude_code)
+            else:
+                cached = self._rank_in_category(state, rows, category, num_recommendations, exclude_code)
+            if len(state.results_cache) >= RESULTS_CACHE_SIZE:
+                state.results_cache.clear()
+            state.results_cache[key] = cached
+        return [dict(rec) for rec in cached]
+
+    def get_recommendations_batch(self, product_names, num_recommendations=5):
+        """Recommendations for many named products, gathered from the neighbor table at once"""
+        self.ensure_loaded()
+        state = self.state
+        results = {name: [] for name in product_names}
+        if not state.ready:
+            return results
+
+        pending = []
+        for name in results:
+            cached = state.results_cache.get((name, num_recommendations, None))
+            if cached is not None:
+                results[name] = [dict(rec) for rec in cached]
+            elif name in state.rows_by_name:
+                pending.append(name)
+        if not pending:
+            return results
+
+        if self.index_mode == 'ann' and state.ann_index is not None:
+            for name in pending:
+                results[name] = self.get_recommendations(name, num_recommendations)
+            return results
+
+        # One fancy-indexed gather for every requested row, then split per product
+        row_groups = [state.rows_by_name[name] for name in pending]
+        all_rows = np.concatenate(row_groups)
+        candidates = np.asarray(state.neighbor_indices[all_rows])
+        scores = np.asarray(state.neighbor_scores[all_rows])
+        bounds = np.cumsum([0] + [len(rows) for rows in row_groups])
+        for name, start, stop in zip(pending, bounds[:-1], bounds[1:]):
+            ranked = self._top_distinct(state, candidates[start:stop].ravel(), scores[start:stop].ravel(),
+                                        num_recommendations, exclude_code=state.code_by_name[name])
+            if len(state.results_cache) >= RESULTS_CACHE_SIZE:
+                state.results_cache.clear()
+            state.results_cache[(name, num_recommendations, None)] = ranked
+            results[name] = [dict(rec) for rec in ranked]
+        return results
+
+    def recommend_for_vector(self, vector, num_recommendations=5, exclude_names=()):
+        """
+        Rank the ML catalog against an arbitrary TF-IDF space vector.
+
+        ``vector`` is a dense array over the vectorizer's vocabulary. Every row
+        is scored in one sparse matrix-vector product; only the best few
+        hundred rows are then grouped by name.
+        """
+        self.ensure_loaded()
+        state = self.state
+        if not state.ready or state.tfidf_matrix is None:
+            return []
+
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        if not norm or len(vector) != state.tfidf_matrix.shape[1]:
+            # Zero, or built against another model version's vocabulary
+            return []
+        exclude_codes = [state.code_by_name[name] for name in exclude_names if name in state.code_by_name]
+        return self._rank_scores(state, state.tfidf_matrix @ (vector / norm), num_recommendations, exclude_codes)
+
+    def search(self, query, num_results=10):
+        """
+        Rank the ML catalog against a free-text query.
+
+        The query is transformed with the model's own vectorizer, so it lands
+        in the same L2-normalized TF-IDF space as the stored rows and one
+        sparse matrix-vector product gives every row's cosine similarity.
+        """
+        self.ensure_loaded()
+        state = self.state
+        if not state.ready or state.tfidf_matrix is None or state.vectorizer is None:
+            return []
+
+        key = ('search', query, num_results)
+        cached = state.results_cache.get(key)
+        if cached is None:
+            query_vector = state.vectorizer.transform([query]).astype(np.float32)
+            if not query_vector.nnz:
+                return []
+            scores = np.asarray((state.tfidf_matrix @ query_vector.T).toarray()).ravel()
+            cached = self._rank_scores(state, scores, num_results)
+            if len(state.results_cache) >= RESULTS_CACHE_SIZE:
+                state.results_cache.clear()
+            state.results_cache[key] = cached
+        return [dict(result) for result in cached]
+
+    def _rank_scores(self, state, scores, num_recommendations, exclude_codes=-1, rows=None):
+        """Best distinct names given a score for every catalog row, or for each of ``rows``"""
+        shortlist = min(len(scores), max(VECTOR_SHORTLIST, num_recommendations * 20))
+        while True:
+            if shortlist < len(scores):
+                candidates = np.argpartition(-scores, shortlist - 1)[:shortlist]
+            else:
+                candidates = np.arange(len(scores))
+            ranked = self._top_distinct(state, candidates if rows is None else rows[candidates], scores[candidates],
+                                        num_recommendations, exclude_codes)
+            # Duplicate names can crowd the shortlist; widen it until enough distinct ones appear
+            if len(ranked) >= num_recommendations or shortlist >= len(scores):
+                return ranked
+            shortlist = min(len(scores), shortlist * 8)
+
+    def get_recommendations_by_id(self, product_id, num_recommendations=5, same_category=False):
+        """Get products similar to the ML product with the given product_id"""
+        self.ensure_loaded()
+        state = self.state
+        if not state.ready:
+            return []
+
+        row = state.row_by_id.get(product_id)
+        if row is None:
+            return []
+        if same_category:
+            return self._rank_in_category(state, [row], state.catalog[row]['category'], num_recommendations,
+                                          exclude_code=state.name_codes[row])
+        return self._rank(state, [row], num_recommendations, exclude_code=state.name_codes[row])
+
+    def apply_product_update(self, ml_product, text):
+        """
+        Fold one new or changed ML product into the loaded model without a full retrain.
+
+        The product is vectorized with the existing vectorizer and scored against
+        every row in one sparse product. That gives its own neighbor list and
+        patches the lists of the products it now belongs in. The result is
+        published as a new artifact version so other workers pick it up too.
+        The patch starts from the version published last, loaded here if this
+        worker has not picked it up yet, and the publish lock is held until the
+        result is published, so concurrent updates from other workers are not lost.
+        Returns the names whose neighbor lists changed (the product's own among
+        them), or None when there is no model to patch.
+        """
+        self.ensure_loaded()
+        with self._lock, ml_artifacts.publish_lock(self.artifacts_dir):
+            current = ml_artifacts.current_version(self.artifacts_dir)
+            if current and current != self.state.version:
+                self.load(current)
+            state = self.state
+            if not state.ready or state.vectorizer is None or state.tfidf_matrix is None:
+                return None
+
+            vector = state.vectorizer.transform([text]).astype(np.float32)
+            norm = np.sqrt(vector.multiply(vector).sum())
+            if norm:
+                vector = vector / norm
+            vector = sp.csr_matrix(vector)
+
+            indices = np.array(state.neighbor_indices)
+            scores = np.array(state.neighbor_scores)
+            product_ids = np.array(state.product_ids)
+            catalog = list(state.catalog)
+            matrix = state.tfidf_matrix
+
+            row = state.row_by_id.get(ml_product['product_id'])
+            changed_names = {ml_product['product_name']}
+            if row is None:
+                # New product: append a row everywhere
+                row = matrix.shape[0]
+                matrix = sp.vstack([matrix, vector], format='csr')
+                indices = np.vstack([indices, np.zeros((1, indices.shape[1]), dtype=indices.dtype)])
+                scores = np.vstack([scores, np.full((1, scores.shape[1]), -np.inf, dtype=scores.dtype)])
+                product_ids = np.append(product_ids, ml_product['product_id'])
+                catalog.append(ml_product)
+            else:
+                matrix = sp.vstack([matrix[:row], vector, matrix[row + 1:]], format='csr')
+                if catalog[row]:
+                    # A rename leaves the old name's remaining rows with one fewer neighbor list
+                    changed_names.add(catalog[row]['product_name'])
+                catalog[row] = ml_product
+
+            similarities = np.asarray(matrix @ vector.T.toarray()).ravel().astype(np.float32)
+            k = indices.shape[1]
+            if k:
+                own_indices, own_scores = top_k_neighbors(similarities[np.newaxis, :], k, row_offset=row)
+                width = own_indices.shape[1]
+                indices[row, :width], scores[row, :width] = own_indices[0], own_scores[0]
+                changed_rows = self._patch_neighbor_lists(indices, scores, row, similarities, matrix)
+                changed_names.update(catalog[r]['product_name'] for r in changed_rows if catalog[r])
+
+            drift_counts = state.drift_counts + self._vocabulary_drift(state.vectorizer, text)
+            if self._maybe_refit(drift_counts):
+                # The refit covers everything drifted so far; don't let this or other workers start another
+                drift_counts = np.zeros(2, dtype=np.int64)
+            ann_index = None
+            if state.ann_index is not None:
+                ann_index = LSHIndex.build(matrix, n_tables=state.ann_index.n_tables, n_bits=state.ann_index.n_bits)
+
+            new_state = ModelState(None, state.vectorizer, indices, scores, catalog, matrix, ann_index,
+                                   product_ids, drift_counts)
+            new_state.version = self._publish_state(new_state)
+            self.state = new_state
+            self._last_check = time.monotonic()
+        return changed_names
+
+    @staticmethod
+    def _patch_neighbor_lists(indices, scores, row, similarities, matrix):
+        """Update every other row's top-K list for the new similarities to ``row``; returns the rows touched"""
+        listed = indices == row
+        has_row = listed.any(axis=1)
+        has_row[row] = False
+
+        # Rows that ranked it higher than it now scores may have lost it to a row
+        # outside their stored top-K, so those few are recomputed exactly
+        hit_rows, hit_cols = np.nonzero(listed & has_row[:, np.newaxis])
+        demoted = hit_rows[similarities[hit_rows] < scores[hit_rows, hit_cols]]
+        scores[hit_rows, hit_cols] = similarities[hit_rows]
+        if len(demoted):
+            block = (matrix[demoted] @ matrix.T).toarray()
+            k = indices.shape[1]
+            for i, r in enumerate(demoted):
+                own_indices, own_scores = top_k_neighbors(block[i:i + 1], k, row_offset=r)
+                indices[r, :own_indices.shape[1]], scores[r, :own_scores.shape[1]] = own_indices[0], own_scores[0]
+
+        # Rows not listing it take it if it beats their current worst neighbor
+        joins = ~has_row & (similarities > scores[:, -1])
+        joins[row] = False
+        indices[joins, -1] = row
+        scores[joins, -1] = similarities[joins]
+
+        affected = np.nonzero(has_row | joins)[0]
+        if len(affected):
+            order = np.argsort(-scores[affected], axis=1, kind='stable')
+            indices[affected] = np.take_along_axis(indices[affected], order, axis=1)
+            scores[affected] = np.take_along_axis(scores[affected], order, axis=1)
+        return affected
+
+    @staticmethod
+    def _vocabulary_drift(vectorizer, text):
+        """Count of (out-of-vocabulary, total) tokens in ``text``"""
+        tokens = vectorizer.analyze(text)
+        return np.array([vectorizer.out_of_vocabulary(tokens), len(tokens)], dtype=np.int64)
+
+    def _publish_state(self, state):
+        """Write a patched state as a new artifact version and make it current"""
+        version_dir = ml_artifacts.new_version_dir(self.artifacts_dir)
+        ml_artifacts.save_array(version_dir, 'neighbor_indices', state.neighbor_indices)
+        ml_artifacts.save_array(version_dir, 'neighbor_scores', state.neighbor_scores)
+        ml_artifacts.save_array(version_dir, 'product_ids', state.product_ids)
+        ml_artifacts.save_array(version_dir, 'drift_counts', state.drift_counts)
+        ml_artifacts.save_sparse(version_dir, 'tfidf', state.tfidf_matrix)
+        state.vectorizer.save(version_dir)
+        if state.ann_index is not None:
+            state.ann_index.save(version_dir)
+        return ml_artifacts.publish(self.artifacts_dir, version_dir, keep=Config.ML_ARTIFACTS_KEEP)
+
+    def _maybe_refit(self, drift_counts):
+        """
+        Start a full retrain in the background once vocabulary drift passes the
+        threshold, unless this worker's previous one is still running.
+        Returns whether one was started.
+        """
+        oov, total = int(drift_counts[0]), int(drift_counts[1])
+        if total < Config.RECOMMENDATION_DRIFT_MIN_TOKENS or oov / total <= Config.RECOMMENDATION_DRIFT_THRESHOLD:
+            return False
+        if self._refit_process is not None and self._refit_process.poll() is None:
+            return False
+
+        print(f"Vocabulary drift {oov}/{total} tokens exceeds threshold; starting full refit")
+        try:
+            process = subprocess.Popen(Config.RECOMMENDATION_REFIT_COMMAND)
+        except OSError as e:
+            print(f"Error starting recommendation refit: {e}")
+            return False
+        # Reap it as soon as it exits rather than leaving a zombie until the next drift check
+        threading.Thread(target=process.wait, name='recommendation-refit', daemon=True).start()
+        self._refit_process = process
+        return True
+
+    def stats(self):
+        """Report load time and approximate resident size of the loaded model"""
+        state = self.state
+        arrays = [a for a in (state.neighbor_indices, state.neighbor_scores) if a is not None]
+        if state.tfidf_matrix is not None:
+            arrays += [state.tfidf_matrix.data, state.tfidf_matrix.indices, state.tfidf_matrix.indptr]
+        if state.ann_index is not None:
+            arrays += [state.ann_index.planes, state.ann_index.table_keys, state.ann_index.table_rows]
+        # Memory-mapped arrays live in the shared page cache, not in this worker's heap
+        mapped_bytes = sum(a.nbytes for a in arrays if _is_mapped(a))
+        neighbor_bytes = sum(a.nbytes for a in arrays if not _is_mapped(a))
+        catalog_bytes = sys.getsizeof(state.catalog) + sum(
+            sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values())
+            for row in state.catalog if row
+        )
+        return {
+            'loaded': self._loaded,
+            'version': state.version,
+            'loaded_at': self.loaded_at,
+            'load_seconds': self.load_seconds or 0.0,
+            'catalog_size': len(state.catalog),
+            'neighbors_per_product': state.neighbor_indices.shape[1] if state.neighbor_indices is not None else 0,
+            'index_mode': self.index_mode if state.ann_index is not None else 'table',
+            'mapped_bytes': mapped_bytes,
+            'neighbor_bytes': neighbor_bytes,
+            'catalog_bytes': catalog_bytes,
+            'resident_bytes': neighbor_bytes + catalog_bytes
+        }
+
+# Shared by every request handled in this process
+recommendation_engine = RecommendationEngine()
@@ -0,0 +1,312 @@
+from models.database import Product
+from services.catalog_cache import CatalogCache
+from config import Config
+import numpy as np
+import threading
+import bisect
+import math
+import time
+import re
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# A product's name counts more than its category, and both more than its description
+FIELD_WEIGHTS = (('name', 3), ('category', 2), ('description', 1))
+
+# BM25 term-frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+def tokenize(text):
+    """Lowercased word tokens of ``text``"""
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+def trigrams(text):
+    """Character trigrams of each word in ``text``, padded like PostgreSQL's pg_trgm"""
+    grams = set()
+    for token in tokenize(text):
+        padded = f"  {token} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class ProductSearchIndex:
+    """
+    In-process inverted index over product name, category and description.
+
+    Postings are nested dicts (term -> product id -> weighted term frequency),
+    so creating, editing or deleting a product touches only that product's
+    terms. Queries are ranked with BM25. Each term's postings are also kept
+    sorted by BM25 impact, built on first use and dropped when the term
+    changes. A query then reads at most SEARCH_POSTINGS_PER_TERM entries per
+    term, however many products contain it.
+
+    Product names and categories are also indexed by character trigram, so
+    misspelled queries ("panir", "butter milk") still find products through
+    ``fuzzy_search``. Trigram postings point at distinct strings rather than
+    products, since many products share a category or a name.
+
+    For autocomplete, each name and category is kept in a sorted list, and
+    each of its later word-start suffixes ("peda" of "kandhi peda") in a
+    second one. ``suggest`` bisects both.
+
+    Other workers' writes are picked up when the shared catalog version
+    moves: every product's updated_at is compared with the one indexed, so
+    edits are re-indexed and deleted ids removed.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.postings = {}
+        self.doc_terms = {}
+        self.doc_updated = {}
+        self.doc_lengths = {}
+        self.total_length = 0
+        self._impacts = {}
+        self.trigram_postings = {}
+        self.fuzzy_keys = {}
+        self.fuzzy_products = []
+        self.fuzzy_texts = []
+        self.doc_fuzzy_keys = {}
+        self.fuzzy_sizes = []
+        self._trigram_arrays = {}
+        self._fuzzy_sizes_array = None
+        self.prefixes = ([], [])
+        self._prefixes_sorted = True
+        self._loaded = False
+        self._catalog_version = None
+        self._last_sync = 0.0
+
+    def build(self):
+        """Index every product from the database, replacing the current contents"""
+        with self._lock:
+            # Read the version before the rows: a write landing in between only causes one extra sync
+            self._catalog_version = CatalogCache.stored_version()
+            self.postings, self.doc_terms, self.doc_lengths, self._impacts = {}, {}, {}, {}
+            self.doc_updated = {}
+            self.trigram_postings, self.fuzzy_keys, self._trigram_arrays = {}, {}, {}
+            self.fuzzy_products, self.fuzzy_sizes, self.doc_fuzzy_keys = [], [], {}
+            self.fuzzy_texts, self._fuzzy_sizes_array = [], None
+            self.prefixes, self._prefixes_sorted = ([], []), False
+            self.total_length = 0
+            for product in Product.query.order_by(Product.id).yield_per(1000):
+                self.add(product)
+            self._sort_prefixes()
+            self._loaded = True
+            self._last_sync = time.monotonic()
+
+    def sync(self, force=False):
+        """Build on first use, then apply products created, edited or deleted through other workers"""
+        if not self._loaded:
+            self.build()
+            return
+        now = time.monotonic()
+        if not force and now - self._last_sync < Config.SEARCH_SYNC_SECONDS:
+            return
+        with self._lock:
+            version = CatalogCache.stored_version()
+            # Without a readable version, compare on every sync
+            if version is None or version != self._catalog_version:
+                self._apply_changes()
+            self._catalog_version = version
+            self._last_sync = now
+
+    def _apply_changes(self):
+        """Re-index products whose updated_at differs from the indexed one and drop deleted ones"""
+        stamps = dict(Product.query.with_entities(Product.id, Product.updated_at))
+        for product_id in [product_id for product_id in self.doc_terms if product_id not in stamps]:
+            self.remove(product_id)
+        changed = [product_id for product_id, updated_at in stamps.items()
+                   if product_id not in self.doc_terms or self.doc_updated.get(product_id) != updated_at]
+        for start in range(0, len(changed), 1000):
+            for product in Product.query.filter(Product.id.in_(changed[start:start + 1000])):
+                self.add(product)
+
+    def add(self, product):
+        """Index a new product, or re-index an edited one"""
+        terms = {}
+        for field, weight in FIELD_WEIGHTS:
+            for token in tokenize(getattr(product, field)):
+                terms[token] = terms.get(token, 0) + weight
+        with self._lock:
+            self.remove(product.id)
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, {})[product.id] = frequency
+                self._impacts.pop(term, None)
+            self.doc_terms[product.id] = terms
+            self.doc_updated[product.id] = product.updated_at
+            self.doc_lengths[product.id] = sum(terms.values())
+            self.total_length += self.doc_lengths[product.id]
+            keys = [self._fuzzy_key(text, kind) for text, kind in
+                    ((product.name, 'product'), (product.category, 'category')) if text]
+            for key in keys:
+                self.fuzzy_products[key].add(product.id)
+            self.doc_fuzzy_keys[product.id] = keys
+
+    def remove(self, product_id):
+        """Drop a product from the index"""
+        with self._lock:
+            terms = self.doc_terms.pop(product_id, None)
+            if terms is None:
+                return
+            self.doc_updated.pop(product_id, None)
+            for term in terms:
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(product_id, None)
+                    if not postings:
+                        del self.postings[term]
+                self._impacts.pop(term, None)
+            self.total_length -= self.doc_lengths.pop(product_id)
+            # A string no product uses any more just stops matching
+            for key in self.doc_fuzzy_keys.pop(product_id, ()):
+                self.fuzzy_products[key].discard(product_id)
+
+    def _fuzzy_key(self, text, kind):
+        """Slot of a distinct name or category string, indexing it the first time it is seen"""
+        key = self.fuzzy_keys.get((text, kind))
+        if key is None:
+            key = len(self.fuzzy_products)
+            self.fuzzy_keys[(text, kind)] = key
+            self.fuzzy_products.append(set())
+            self.fuzzy_texts.append((text, kind))
+            grams = trigrams(text)
+            self.fuzzy_sizes.append(len(grams))
+            self._fuzzy_sizes_array = None
+            for gram in grams:
+                self.trigram_postings.setdefault(gram, []).append(key)
+                self._trigram_arrays.pop(gram, None)
+            tokens = tokenize(text)
+            for start in range(len(tokens)):
+                entries = self.prefixes[start > 0]
+                entry = (' '.join(tokens[start:]), key)
+                # A full build appends everything and sorts once at the end
+                if self._prefixes_sorted:
+                    bisect.insort(entries, entry)
+                else:
+                    entries.append(entry)
+        return key
+
+    def _sort_prefixes(self):
+        if not self._prefixes_sorted:
+            for entries in self.prefixes:
+                entries.sort()
+            self._prefixes_sorted = True
+
+    def _term_impacts(self, term):
+        """The term's (product ids, BM25 contributions), best first"""
+        impacts = self._impacts.get(term)
+        if impacts is None:
+            postings = self.postings.get(term)
+            if not postings:
+                return None
+            n_docs = len(self.doc_lengths)
+            average_length = self.total_length / n_docs
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            product_ids = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+            frequencies = np.fromiter(postings.values(), dtype=np.float64, count=len(postings))
+            lengths = np.fromiter((self.doc_lengths[pid] for pid in postings), dtype=np.float64, count=len(postings))
+            scores = idf * frequencies * (BM25_K1 + 1) / (
+                frequencies + BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length))
+            order = np.lexsort((product_ids, -scores))
+            impacts = (product_ids[order], scores[order])
+            self._impacts[term] = impacts
+        return impacts
+
+    def search(self, query, limit=20):
+        """Product ids ranked by BM25 relevance to ``query``, with their scores"""
+        self.sync()
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or limit <= 0:
+            return []
+
+        with self._lock:
+            found = [self._term_impacts(term) for term in terms]
+        found = [impacts for impacts in found if impacts is not None]
+        if not found:
+            return []
+
+        # Sum each product's contributions over the best postings of every query term
+        depth = Config.SEARCH_POSTINGS_PER_TERM
+        product_ids = np.concatenate([ids[:depth] for ids, _ in found])
+        scores = np.concatenate([scores[:depth] for _, scores in found])
+        unique_ids, positions = np.unique(product_ids, return_inverse=True)
+        totals = np.bincount(positions, weights=scores)
+
+        # unique_ids is sorted, so a stable sort breaks ties by product id
+        top = np.argsort(-totals, kind='stable')[:limit]
+        return [(int(unique_ids[i]), float(totals[i])) for i in top]
+
+    def fuzzy_search(self, query, limit=20, threshold=None):
+        """
+        Product ids whose name or category looks like ``query``, with their
+        trigram similarity (shared trigrams over all trigrams of both strings),
+        most similar first.
+        """
+        self.sync()
+        threshold = Config.SEARCH_FUZZY_THRESHOLD if threshold is None else threshold
+        grams = trigrams(query)
+        if not grams or limit <= 0:
+            return []
+
+        with self._lock:
+            found = []
+            for gram in grams:
+                keys = self._trigram_arrays.get(gram)
+                if keys is None and gram in self.trigram_postings:
+                    keys = np.asarray(self.trigram_postings[gram], dtype=np.int32)
+                    self._trigram_arrays[gram] = keys
+                if keys is not None:
+                    found.append(keys)
+            if not found:
+                return []
+            if self._fuzzy_sizes_array is None:
+                self._fuzzy_sizes_array = np.asarray(self.fuzzy_sizes, dtype=np.float64)
+            sizes = self._fuzzy_sizes_array
+            fuzzy_products = self.fuzzy_products
+
+        shared = np.bincount(np.concatenate(found), minlength=len(sizes))
+        similarity = shared / (len(grams) + sizes - shared)
+        candidates = np.flatnonzero(similarity >= threshold)
+        # Most similar first, ties by the order strings were first indexed
+        candidates = candidates[np.lexsort((candidates, -similarity[candidates]))]
+
+        results, seen = [], set()
+        for key in candidates:
+            for product_id in sorted(fuzzy_products[key] - seen):
+                seen.add(product_id)
+                results.append((product_id, float(similarity[key])))
+                if len(results) >= limit:
+                    return results
+        return results
+
+    def suggest(self, prefix, limit=10):
+        """
+        Names and categories with a word starting with ``prefix``, as
+        (text, 'product' or 'category') pairs. Strings that start with the
+        prefix come first, then those with a later word matching it, each
+        group alphabetically.
+        """
+        self.sync()
+        prefix = ' '.join(tokenize(prefix))
+        if not prefix or limit <= 0:
+            return []
+
+        results, seen = [], set()
+        with self._lock:
+            self._sort_prefixes()
+            for entries in self.prefixes:
+                for i in range(bisect.bisect_left(entries, (prefix,)), len(entries)):
+                    suffix, key = entries[i]
+                    if not suffix.startswith(prefix):
+                        break
+                    # Strings no product uses any more stay listed but are skipped
+                    if key in seen or not self.fuzzy_products[key]:
+                        continue
+                    seen.add(key)
+                    results.append(self.fuzzy_texts[key])
+                    if len(results) >= limit:
+                        return results
+        return results
+
+# Shared by every request handled in this process
+product_search = ProductSearchIndex()
@@ -0,0 +1,29 @@
+import numpy as np
+
+def top_k_neighbors(sim_block, k, row_offset=0):
+    """
+    Reduce a block of similarity rows to each row's top-k neighbors.
+
+    ``sim_block`` holds the similarities of rows ``row_offset..row_offset+len``
+    against the whole catalog. A row is never returned as its own neighbor.
+    Returns ``(indices, scores)`` arrays of shape (rows, k), best first.
+    """
+    sim_block = np.array(sim_block, dtype=np.float32)
+    n_rows, n_cols = sim_block.shape
+    k = min(k, n_cols - 1)
+    if k <= 0:
+        return np.empty((n_rows, 0), dtype=np.int32), np.empty((n_rows, 0), dtype=np.float32)
+
+    # Exclude self-similarity
+    rows = np.arange(n_rows)
+    self_cols = rows + row_offset
+    in_range = self_cols < n_cols
+    sim_block[rows[in_range], self_cols[in_range]] = -np.inf
+
+    indices = np.argpartition(-sim_block, k - 1, axis=1)[:, :k]
+    scores = np.take_along_axis(sim_block, indices, axis=1)
+
+    order = np.argsort(-scores, axis=1, kind='stable')
+    indices = np.take_along_axis(indices, order, axis=1)
+    scores = np.take_along_axis(scores, order, axis=1)
+    return indices.astype(np.int32), scores.astype(np.float32)
@@ -0,0 +1,186 @@
+"""
+Query-time TF-IDF vectorizers stored as plain NumPy arrays.
+
+``CompactTfidfVectorizer`` reproduces a fitted scikit-learn ``TfidfVectorizer``
+(default word tokens, lowercase, stop words, smooth IDF, L2 norm) from its
+sorted vocabulary and IDF weights. Loading one is a few ``np.load`` calls
+instead of unpickling a vocabulary dict, and scikit-learn is never imported.
+
+``HashingTfidfVectorizer`` hashes tokens straight to columns, so it keeps no
+vocabulary at all; words never seen in training land in columns with no weight.
+"""
+from services import ml_artifacts
+from array import array
+import scipy.sparse as sp
+import numpy as np
+import zlib
+import re
+import os
+
+# scikit-learn's default token_pattern
+TOKEN_PATTERN = re.compile(r'(?u)\b\w\w+\b')
+
+HASHING_FILE = 'vectorizer_hashing'
+
+def _l2_normalize_rows(matrix):
+    """Scale every non-empty row of a float CSR matrix to unit length, in place"""
+    lengths = np.diff(matrix.indptr)
+    squares = np.bincount(np.repeat(np.arange(matrix.shape[0]), lengths),
+                          weights=matrix.data.astype(np.float64) ** 2, minlength=matrix.shape[0])
+    norms = np.sqrt(squares)
+    norms[norms == 0] = 1.0
+    matrix.data /= np.repeat(norms, lengths).astype(matrix.data.dtype)
+    return matrix
+
+def _smooth_idf(document_frequency, n_documents):
+    """scikit-learn's smoothed IDF: ln((1 + n) / (1 + df)) + 1"""
+    return (np.log((1 + n_documents) / (1 + document_frequency.astype(np.float64))) + 1).astype(np.float32)
+
+class _TfidfBase:
+    """Tokenizing, TF-IDF weighting and normalization shared by both vectorizers"""
+
+    def __init__(self, idf, stop_words):
+        self.idf = idf
+        self.stop_words = frozenset(str(word) for word in stop_words)
+
+    @property
+    def n_features(self):
+        return len(self.idf)
+
+    def analyze(self, text):
+        """Lowercased word tokens of ``text`` without stop words"""
+        return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in self.stop_words]
+
+    def _columns(self, tokens):
+        raise NotImplementedError
+
+    def count(self, texts):
+        """Raw term counts, one CSR row per text; ``texts`` may be any single-pass iterable"""
+        # Flat growable buffers, so a long stream costs 4 bytes per token rather than an array per text
+        columns = array('i')
+        indptr = array('q', [0])
+        for text in texts:
+            found = self._columns(self.analyze(text))
+            columns.frombytes(np.asarray(found, dtype=np.int32).tobytes())
+            indptr.append(len(columns))
+        columns = np.frombuffer(columns, dtype=np.int32) if len(columns) else np.empty(0, dtype=np.int32)
+        counts = sp.csr_matrix((np.ones(len(columns), dtype=np.float32), columns, np.frombuffer(indptr, dtype=np.int64)),
+                               shape=(len(indptr) - 1, self.n_features))
+        counts.sum_duplicates()
+        return counts
+
+    def transform(self, texts):
+        """L2-normalized float32 TF-IDF rows for ``texts``"""
+        matrix = self.count(texts)
+        matrix.data *= self.idf[matrix.indices]
+        matrix.eliminate_zeros()
+        return _l2_normalize_rows(matrix)
+
+    def out_of_vocabulary(self, tokens):
+        """How many of ``tokens`` the vectorizer has no column for"""
+        return 0
+
+class CompactTfidfVectorizer(_TfidfBase):
+    """A fitted TF-IDF vocabulary as a sorted UTF-8 term array plus IDF weights"""
+
+    def __init__(self, vocabulary, idf, stop_words):
+        super().__init__(idf, stop_words)
+        self.vocabulary = vocabulary
+
+    @classmethod
+    def from_sklearn(cls, vectorizer):
+        """Convert a fitted scikit-learn TfidfVectorizer that uses the default word analyzer"""
+        if (vectorizer.analyzer != 'word' or vectorizer.ngram_range != (1, 1) or not vectorizer.lowercase
+                or vectorizer.tokenizer is not None or vectorizer.preprocessor is not None
+                or vectorizer.token_pattern != TOKEN_PATTERN.pattern or vectorizer.strip_accents is not None
+                or vectorizer.norm != 'l2' or not vectorizer.use_idf or vectorizer.sublinear_tf
+                or not vectorizer.smooth_idf):
+            raise ValueError("Only default word-level TF-IDF settings can be stored in compact form")
+
+        terms = np.array([term.encode('utf-8') for term in vectorizer.get_feature_names_out()])
+        if len(terms) > 1 and not np.all(terms[:-1] < terms[1:]):
+            raise ValueError("Vectorizer columns are not in sorted vocabulary order")
+        stop_words = sorted(vectorizer.get_stop_words() or ())
+        return cls(terms, vectorizer.idf_.astype(np.float32), stop_words)
+
+    def _columns(self, tokens):
+        if not tokens or not len(self.vocabulary):
+            return np.empty(0, dtype=np.int32)
+        encoded = np.array([token.encode('utf-8') for token in tokens], dtype=self.vocabulary.dtype)
+        # Tokens longer than the widest term are truncated above, so compare the full bytes
+        positions = np.minimum(np.searchsorted(self.vocabulary, encoded), len(self.vocabulary) - 1)
+        found = np.array([self.vocabulary[p] == token.encode('utf-8') for p, token in zip(positions, tokens)],
+                         dtype=bool)
+        return positions[found].astype(np.int32)
+
+    def out_of_vocabulary(self, tokens):
+        return len(tokens) - len(self._columns(tokens))
+
+    def save(self, version_dir):
+        ml_artifacts.save_array(version_dir, 'vectorizer_vocabulary', self.vocabulary)
+        ml_artifacts.save_array(version_dir, 'vectorizer_idf', self.idf)
+        ml_artifacts.save_array(version_dir, 'vectorizer_stop_words', np.array(sorted(self.stop_words)))
+
+    @classmethod
+    def load(cls, version_dir):
+        """Memory-map a saved vocabulary, or return None if the version has none"""
+        vocabulary = ml_artifacts.load_array(version_dir, 'vectorizer_vocabulary')
+        idf = ml_artifacts.load_array(version_dir, 'vectorizer_idf')
+        stop_words = ml_artifacts.load_array(version_dir, 'vectorizer_stop_words', mmap=False)
+        if vocabulary is None or idf is None:
+            return None
+        return cls(vocabulary, idf, stop_words if stop_words is not None else ())
+
+class HashingTfidfVectorizer(_TfidfBase):
+    """TF-IDF over ``n_features`` hashed columns (CRC32 of each token); no vocabulary is kept"""
+
+    def __init__(self, n_features, idf=None, stop_words=()):
+        super().__init__(idf if idf is not None else np.ones(n_features, dtype=np.float32), stop_words)
+
+    @classmethod
+    def fit(cls, texts, n_features, stop_words=()):
+        """Learn IDF weights per hashed column from ``texts``"""
+        return cls.fit_transform(texts, n_features, stop_words)[0]
+
+    @classmethod
+    def fit_transform(cls, texts, n_features, stop_words=()):
+        """Fit on ``texts`` and return (vectorizer, TF-IDF rows) in a single pass over them"""
+        vectorizer = cls(n_features, stop_words=stop_words)
+        matrix = vectorizer.count(texts)
+        document_frequency = np.bincount(matrix.indices, minlength=n_features)
+        idf = _smooth_idf(document_frequency, matrix.shape[0])
+        # Columns no training text hashed to would only ever hold unseen words; give them no weight
+        idf[document_frequency == 0] = 0
+        vectorizer.idf = idf
+        matrix.data *= idf[matrix.indices]
+        return vectorizer, _l2_normalize_rows(matrix)
+
+    def _columns(self, tokens):
+        return np.array([zlib.crc32(token.encode('utf-8')) % self.n_features for token in tokens], dtype=np.int32)
+
+    def save(self, version_dir):
+        ml_artifacts.save_array(version_dir, HASHING_FILE, np.array([self.n_features], dtype=np.int64))
+        ml_artifacts.save_array(version_dir, 'vectorizer_idf', self.idf)
+        ml_artifacts.save_array(version_dir, 'vectorizer_stop_words', np.array(sorted(self.stop_words)))
+
+    @classmethod
+    def load(cls, version_dir):
+        """Load a saved hashing vectorizer, or return None if the version has none"""
+        settings = ml_artifacts.load_array(version_dir, HASHING_FILE, mmap=False)
+        if settings is None:
+            return None
+        idf = ml_artifacts.load_array(version_dir, 'vectorizer_idf')
+        stop_words = ml_artifacts.load_array(version_dir, 'vectorizer_stop_words', mmap=False)
+        return cls(int(settings[0]), idf, stop_words if stop_words is not None else ())
+
+def load_vectorizer(version_dir):
+    """The vectorizer saved with a version, whichever format it was saved in"""
+    if os.path.exists(os.path.join(version_dir, f'{HASHING_FILE}.npy')):
+        return HashingTfidfVectorizer.load(version_dir)
+    vectorizer = CompactTfidfVectorizer.load(version_dir)
+    if vectorizer is None:
+        # Versions published before the compact format pickled the scikit-learn object
+        vectorizer = ml_artifacts.load_vectorizer(version_dir)
+        if vectorizer is not None:
+            vectorizer = CompactTfidfVectorizer.from_sklearn(vectorizer)
+    return vectorizer